@@ -0,0 +1,251 @@
+"""
+Benchmark the pipeline hot paths on synthetic data.
+
+    python -m benchmarks.run --scale small --save-baseline benchmarks/baseline.json
+    python -m benchmarks.run --scale small        # compares against the saved baseline
+    python -m benchmarks.run --scale medium --baseline benchmarks/baseline_medium.json
+
+Every case runs inside a scratch directory, so the relative output/ paths
+the pipeline writes to never touch the real outputs.
+"""
+
+import os, json
+import sys
+import time
+import shutil
+import argparse
+import platform
+import tempfile
+import contextlib
+from datetime import datetime
+
+from benchmarks.synthetic import (
+    write_data_dir, make_awards_list, make_signal_json, write_clustering_results,
+    make_pattern_results, phrase_vocab, cluster_name_vocab, skewed_award_counts, SimulatedLatencyLLM
+)
+
+SCALES = {
+    # name: (awards, employees, e2e employees)
+    "small": (1_000, 100, 5),
+    "medium": (100_000, 10_000, 20),
+    "large": (1_000_000, 100_000, 50),
+}
+REGRESSION_THRESHOLD = 1.25
+
+
+@contextlib.contextmanager
+def scratch_dir():
+    cwd = os.getcwd()
+    path = tempfile.mkdtemp(prefix="wh_bench_")
+    os.chdir(path)
+    try:
+        yield path
+    finally:
+        os.chdir(cwd)
+        shutil.rmtree(path, ignore_errors=True)
+
+
+@contextlib.contextmanager
+def quiet():
+    with open(os.devnull, "w") as devnull, contextlib.redirect_stdout(devnull):
+        yield
+
+
+def timeit(fn, repeats):
+    best = float("inf")
+    for _ in range(repeats):
+        start = time.perf_counter()
+        with quiet():
+            fn()
+        best = min(best, time.perf_counter() - start)
+    return best
+
+
+def run_benchmarks(scale, repeats=3, latency=0.05, token_latency=0.0002):
+    from src.data_preprocessor import aggregate_employee_data
+    from src.workflows.employee_cluster import EmployeeCluster
+    from src.workflows.global_cluster import GlobalCluster
+    from src.models.hedged_wrapper import HedgedLLMWrapper
+    from src.parallel import longest_first
+    from src.schemas import encode
+    from utils.utils import (
+        chunk_awards, count_tokens, extract_phrase_set, merge_signal_set, parse_json_from_llm, parse_signal_lines
+    )
+
+    n_awards, n_employees, n_e2e = SCALES[scale]
+    vocab = phrase_vocab()
+    results = {}
+
+    def record(name, seconds, items):
+        results[name] = {"seconds": round(seconds, 6), "items": items, "items_per_sec": round(items / seconds, 2)}
+        print(f"{name:<32} {seconds:>10.4f}s  {items / seconds:>14,.0f} items/s")
+
+    with scratch_dir():
+        with quiet():
+            write_data_dir("data", n_awards, n_employees)
+        record("aggregate_employee_data", timeit(lambda: aggregate_employee_data("data"), repeats), n_awards)
+
+        awards = make_awards_list(min(n_awards, 20_000))
+        record("chunk_awards", timeit(lambda: chunk_awards(0, awards, save_debug_chunks=False), repeats), len(awards))
+
+        signals = make_signal_json(min(n_awards, 100_000), vocab)
+        record("extract_phrase_set", timeit(lambda: extract_phrase_set(signals), repeats), len(signals))
+
+        raw = "```json\n" + json.dumps(signals, indent=2) + "\n```"
+        record("parse_json_from_llm", timeit(lambda: parse_json_from_llm(raw, schema="keywords"), repeats), len(signals))
+        record("encode_keywords", timeit(lambda: encode(signals), repeats), len(signals))
+
+        lines = "\n".join(f"{a}\t{c}\t{s}" for a, chunks in signals.items() for c, sigs in chunks.items() for s in sigs)
+        record("parse_signal_lines", timeit(lambda: parse_signal_lines(lines), repeats), len(signals))
+
+        with quiet():
+            write_clustering_results("output", n_employees)
+        record("merge_signal_set", timeit(lambda: merge_signal_set("output/True") + merge_signal_set("output/False"), repeats), n_employees)
+
+        names = cluster_name_vocab()
+        os.makedirs("patterns", exist_ok=True)
+        for fname in ("vp.json", "non_vp.json"):
+            with open(os.path.join("patterns", fname), "w", encoding="utf-8") as f:
+                json.dump(make_pattern_results(names), f)
+
+        global_cluster = GlobalCluster("anthropic", "simulated", 0, "none")
+        global_cluster.llm = SimulatedLatencyLLM(latency=latency)
+        record(
+            "generate_canonical_taxonomy",
+            timeit(lambda: global_cluster.generate_canonical_taxonomy("patterns/vp.json", "patterns/non_vp.json"), repeats),
+            len(names) * 2,
+        )
+
+        # End to end against the simulated-latency provider
+        employee_cluster = EmployeeCluster("anthropic", "simulated", 0, "none")
+        employee_cluster.llm = SimulatedLatencyLLM(latency=latency)
+        employees = [
+            {"rec_id": i, "awards": make_awards_list(50 + 25 * i, seed=i), "is_vp": i % 5 == 0}
+            for i in range(n_e2e)
+        ]
+
+        def employee_e2e():
+            for e in employees:
+                rec_id, result, is_vp = employee_cluster.extract_raw_signals(e)
+                employee_cluster.clustering_signal(rec_id, extract_phrase_set(result), is_vp)
+
+        record("e2e_employee_cluster", timeit(employee_e2e, 1), len(employees))
+
+        # Same employees through the shared extraction pool, with clustering
+        # on its own threads instead of blocking the extraction loop
+        def employee_pipelined():
+            list(employee_cluster.cluster_all(employee_cluster.extract_all((e, None) for e in employees)))
+
+        record("e2e_employee_pipelined", timeit(employee_pipelined, 1), len(employees))
+
+        # Extraction output format: same simulated answers, JSON vs tab-separated lines
+        for signal_format in ("json", "lines"):
+            extractor = EmployeeCluster("anthropic", "simulated", 0, "none", signal_format=signal_format)
+            extractor.llm = SimulatedLatencyLLM(latency=latency, token_latency=token_latency)
+
+            def extract_all():
+                for e in employees:
+                    extractor.extract_raw_signals(e)
+
+            name = f"extract_signals_{signal_format}"
+            record(name, timeit(extract_all, 1), len(employees))
+            results[name]["output_tokens"] = extractor.llm.output_tokens
+            build_prompt = (extractor._build_extracting_signal_lines_prompt if signal_format == "lines"
+                            else extractor._build_extracting_signal_prompt)
+            results[name]["prompt_tokens"] = count_tokens(build_prompt(""))
+
+        # Skewed award counts and a heavy latency tail: employees one at a time
+        # in list order vs longest-first over a shared pool with hedged calls
+        skewed = []
+        for i, n in enumerate(skewed_award_counts(4 * n_e2e, seed=1)):
+            e = {"rec_id": i, "awards": make_awards_list(n, seed=i), "num_awards": n, "is_vp": False}
+            skewed.append((e, chunk_awards(i, e["awards"], max_tokens=2000, save_debug_chunks=False)))
+        n_chunks = sum(len(c) for _, c in skewed)
+
+        def extract_sequential():
+            extractor = EmployeeCluster("anthropic", "simulated", 0, "none")
+            extractor.llm = SimulatedLatencyLLM(latency=latency, sigma=1.0, token_latency=token_latency)
+            for e, award_chunks in skewed:
+                extractor.extract_raw_signals(e, award_chunks=award_chunks)
+
+        hedge_stats = {}
+
+        def extract_scheduled():
+            extractor = EmployeeCluster("anthropic", "simulated", 0, "none")
+            extractor.llm = HedgedLLMWrapper(
+                SimulatedLatencyLLM(latency=latency, sigma=1.0, token_latency=token_latency), min_samples=10, initial_deadline=10 * latency
+            )
+            chunks_by_id = {e["rec_id"]: c for e, c in skewed}
+            ordered = longest_first([e for e, _ in skewed])
+            list(extractor.extract_all((e, chunks_by_id[e["rec_id"]]) for e in ordered))
+            hedge_stats.update(extractor.llm.stats())
+
+        record("extract_skewed_sequential", timeit(extract_sequential, 1), n_chunks)
+        record("extract_skewed_ljf_hedged", timeit(extract_scheduled, 1), n_chunks)
+        results["extract_skewed_ljf_hedged"]["hedge"] = hedge_stats
+
+        dedup_names = cluster_name_vocab(size=min(5 * n_employees, 2000), seed=1)
+        record(
+            "e2e_global_dedup",
+            timeit(lambda: global_cluster.dedupligate_signals(dedup_names, True), 1),
+            len(dedup_names),
+        )
+
+    return results
+
+
+def compare(results, baseline, threshold=REGRESSION_THRESHOLD):
+    """Return the cases that got slower than threshold x baseline."""
+    regressions = {}
+    for name, current in results.items():
+        base = baseline.get(name)
+        if not base:
+            continue
+        ratio = current["seconds"] / base["seconds"]
+        marker = "REGRESSION" if ratio > threshold else ""
+        print(f"{name:<32} {ratio:>6.2f}x baseline {marker}")
+        if ratio > threshold:
+            regressions[name] = round(ratio, 3)
+    return regressions
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Pipeline benchmarks on synthetic data")
+    parser.add_argument("--scale", choices=list(SCALES), default="small")
+    parser.add_argument("--repeats", type=int, default=3)
+    parser.add_argument("--latency", type=float, default=0.05, help="Median simulated LLM latency (s)")
+    parser.add_argument("--token-latency", type=float, default=0.0002, help="Simulated time per output token (s)")
+    parser.add_argument("--output", default="benchmarks/results.json")
+    parser.add_argument("--baseline", default="benchmarks/baseline.json", help="Baseline JSON to compare against")
+    parser.add_argument("--save-baseline", help="Also write the results as the new baseline")
+    parser.add_argument("--threshold", type=float, default=REGRESSION_THRESHOLD)
+    args = parser.parse_args(argv)
+
+    results = run_benchmarks(args.scale, repeats=args.repeats, latency=args.latency, token_latency=args.token_latency)
+    report = {
+        "scale": args.scale,
+        "timestamp": datetime.now().isoformat(timespec="seconds"),
+        "python": platform.python_version(),
+        "machine": platform.machine(),
+        "cpu_count": os.cpu_count(),
+        "results": results,
+    }
+
+    if args.baseline and os.path.exists(args.baseline):
+        with open(args.baseline, "r", encoding="utf-8") as f:
+            baseline = json.load(f)
+        if baseline.get("scale") != args.scale:
+            print(f"[WARN] Baseline scale '{baseline.get('scale')}' differs from '{args.scale}'")
+        report["regressions"] = compare(results, baseline["results"], args.threshold)
+
+    for path in filter(None, (args.output, args.save_baseline)):
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        with open(path, "w", encoding="utf-8") as f:
+            json.dump(report, f, indent=2)
+        print(f"[Saved] {path}")
+
+    return 1 if report.get("regressions") else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
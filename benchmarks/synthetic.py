@@ -0,0 +1,205 @@
+"""Synthetic data generators and a simulated-latency LLM for benchmarks."""
+
+import os, json
+import re
+import time
+import random
+
+import numpy as np
+import pandas as pd
+
+from src.models.base_wrapper import BaseLLMWrapper
+
+ADJECTIVES = [
+    "strategic", "cross-functional", "executive", "organizational", "operational",
+    "client", "stakeholder", "technical", "complex", "global", "people", "change",
+    "innovation", "program", "commercial", "customer", "team", "enterprise",
+]
+NOUNS = [
+    "leadership", "alignment", "planning", "vision", "execution", "ownership",
+    "influence", "mentorship", "problem-solving", "delivery", "partnership",
+    "transformation", "coordination", "communication", "impact", "excellence",
+]
+TITLES = [
+    "Team Leadership Award", "Innovation Spotlight", "Thank you", "Above and Beyond",
+    "Customer Hero", "Strategy Planning Superstars", "Recognition Award", "Great job",
+]
+JOB_TITLES = [
+    "Software Engineer", "Senior Manager", "Director", "VP Sales", "Vice President, Finance",
+    "Business Development Representative", "Account Executive", "SVP Operations",
+]
+
+
+def phrase_vocab(size=2000, seed=0):
+    rng = random.Random(seed)
+    vocab = {f"{a} {n}" for a in ADJECTIVES for n in NOUNS}
+    while len(vocab) < size:
+        vocab.add(f"{rng.choice(ADJECTIVES)} {rng.choice(NOUNS)} {rng.choice(NOUNS)}")
+    return sorted(vocab)[:size]
+
+
+def cluster_name_vocab(size=500, seed=0):
+    rng = random.Random(seed)
+    names = set()
+    while len(names) < size:
+        a, b = rng.sample(NOUNS, 2)
+        names.add(f"{rng.choice(ADJECTIVES).title()} {a.title()} & {b.title()}")
+    return sorted(names)
+
+
+def _message(rng, words=60):
+    return " ".join(rng.choice(ADJECTIVES + NOUNS + ["the", "team", "and", "for", "thank", "you"]) for _ in range(words))
+
+
+def make_award_frames(n_awards, n_employees, vp_rate=0.1, seed=0):
+    """Return (control_df, treatment_df, history_df) shaped like the raw data files."""
+    rng = np.random.default_rng(seed)
+    prng = random.Random(seed)
+
+    # Skewed award counts per employee, like the real data
+    weights = rng.pareto(1.5, n_employees) + 1
+    rec_ids = rng.choice(np.arange(1, n_employees + 1), size=n_awards, p=weights / weights.sum())
+    messages = [_message(prng, prng.randint(20, 120)) for _ in range(min(n_awards, 5000))]
+
+    awards = pd.DataFrame({
+        "rec_id": rec_ids,
+        "award_id": np.arange(n_awards),
+        "title": [TITLES[i % len(TITLES)] for i in rng.integers(0, len(TITLES), n_awards)],
+        "text": [messages[i % len(messages)] for i in range(n_awards)],
+        "award_date": "2024-01-01",
+    })
+    half = n_awards // 2
+
+    users = np.arange(1, n_employees + 1)
+    is_vp = rng.random(n_employees) < vp_rate
+    history = pd.DataFrame({
+        "pk_user": np.repeat(users, 2),
+        "fk_direct_manager": 0,
+        "job_title": [
+            prng.choice(JOB_TITLES[3:5]) if vp and step else prng.choice(JOB_TITLES[:3])
+            for vp in is_vp for step in (0, 1)
+        ],
+        "effective_start_date": "2020-01-01",
+        "effective_end_date": "2021-01-01",
+    })
+
+    return awards.iloc[:half], awards.iloc[half:], history
+
+
+def write_data_dir(path, n_awards, n_employees, seed=0):
+    os.makedirs(path, exist_ok=True)
+    control_df, treatment_df, history_df = make_award_frames(n_awards, n_employees, seed=seed)
+    control_df.to_json(os.path.join(path, "control_clean.json"))
+    treatment_df.to_json(os.path.join(path, "treatment_clean.json"))
+    history_df.to_csv(os.path.join(path, "wh_history_full.csv"), index=False)
+    return path
+
+
+def make_awards_list(n_awards, seed=0):
+    prng = random.Random(seed)
+    return [{"title": prng.choice(TITLES), "message": _message(prng, prng.randint(20, 120))} for _ in range(n_awards)]
+
+
+def skewed_award_counts(n_employees, cap=400, seed=0):
+    """Heavy-tailed awards per employee: most have a handful, a few have hundreds."""
+    rng = random.Random(seed)
+    counts = [min(cap, int(5 * rng.paretovariate(1.1))) for _ in range(n_employees)]
+    rng.shuffle(counts)
+    return counts
+
+
+def make_signal_json(n_awards, vocab, seed=0):
+    """{award: {chunk: [signals]}} as produced by extract_raw_signals."""
+    rng = random.Random(seed)
+    return {
+        str(a): {str(c): rng.sample(vocab, rng.randint(1, 2)) for c in range(rng.randint(1, 3))}
+        for a in range(n_awards)
+    }
+
+
+def make_clustering_result(vocab, names, seed=0):
+    rng = random.Random(seed)
+    return {
+        name: {"phrases": rng.sample(vocab, rng.randint(2, 8)), "description": "Synthetic cluster."}
+        for name in rng.sample(names, rng.randint(5, 15))
+    }
+
+
+def write_clustering_results(output_dir, n_employees, vp_rate=0.1, seed=0):
+    rng = random.Random(seed)
+    vocab = phrase_vocab(seed=seed)
+    names = cluster_name_vocab(seed=seed)
+
+    for rec_id in range(n_employees):
+        folder = os.path.join(output_dir, str(rng.random() < vp_rate))
+        os.makedirs(folder, exist_ok=True)
+        with open(os.path.join(folder, f"employee_{rec_id}_clustering_result.json"), "w", encoding="utf-8") as f:
+            json.dump(make_clustering_result(vocab, names, seed=rec_id), f)
+
+    return output_dir
+
+
+def make_pattern_results(names, group_size=6):
+    return {
+        names[i]: {"aliases": names[i:i + group_size], "summary": "Synthetic canonical theme."}
+        for i in range(0, len(names), group_size)
+    }
+
+
+class SimulatedLatencyLLM(BaseLLMWrapper):
+    """
+    Stand-in provider that sleeps for `latency` seconds plus `token_latency`
+    per output token, times a lognormal tail factor, and returns well-formed
+    output for each prompt type.
+    """
+
+    def __init__(self, latency=0.05, sigma=0.5, seed=0, token_latency=0.0):
+        super().__init__(model="simulated", api_key=None)
+        self.latency = latency
+        self.sigma = sigma
+        self.token_latency = token_latency
+        self.rng = random.Random(seed)
+        self.vocab = phrase_vocab(seed=seed)
+        self.calls = 0
+        self.output_tokens = 0
+
+    def new_client(self):
+        return None
+
+    def _invoke(self, client, prompt: str) -> str:
+        from utils.utils import count_tokens
+
+        self.calls += 1
+        raw = self._respond(prompt)
+        tokens = count_tokens(raw)
+        self.output_tokens += tokens
+        # A slow replica is slow for the whole response, so the tail scales both terms
+        time.sleep((self.latency + tokens * self.token_latency) * self.rng.lognormvariate(0, self.sigma))
+        return raw
+
+    def _respond(self, prompt):
+        if "NOW PROCESS THE FOLLOWING AWARDS:" in prompt:
+            body = prompt.split("NOW PROCESS THE FOLLOWING AWARDS:")[1]
+            awards = re.findall(r"^\s*(\d+)#", body, flags=re.M)
+            signals = {
+                a: {str(c): self.rng.sample(self.vocab, 2) for c in range(self.rng.randint(1, 3))}
+                for a in awards
+            }
+            if "Return ONLY the signal lines." in prompt:
+                return "\n".join(
+                    f"{a}\t{c}\t{s}" for a, chunks in signals.items() for c, sigs in chunks.items() for s in sigs
+                )
+            # Models imitate the pretty-printed JSON in the prompt
+            return json.dumps(signals, indent=2)
+
+        if "NOW CLUSTER THE FOLLOWING PHRASES:" in prompt:
+            return json.dumps({
+                f"Theme {i}": {"phrases": self.rng.sample(self.vocab, 4), "description": "Synthetic."}
+                for i in range(8)
+            })
+
+        if "NOW DEDUPLICATE THE FOLLOWING NAMES:" in prompt:
+            names = re.findall(r"'([^']+)'", prompt.split("NOW DEDUPLICATE THE FOLLOWING NAMES:")[1])
+            return json.dumps(make_pattern_results(names))
+
+        return "{}"
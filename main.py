@@ -1,5 +1,8 @@
 
 import os, json
+import argparse
+import inspect
+from itertools import chain
 from tqdm import tqdm
 import sys
 import pandas as pd
@@ -7,59 +10,345 @@ from dotenv import load_dotenv
 from src.data_preprocessor import aggregate_employee_data, split_train_data
 from src.workflows.employee_cluster import EmployeeCluster
 from src.workflows.global_cluster import GlobalCluster
+from src.models.provider_factory import LLMProviderFactory
+from src.models.hedged_wrapper import HedgedLLMWrapper
+from src.phrase_cache import PhraseClusterCache
+from src.parallel import make_cpu_pool, prechunk_employees, longest_first
+from src.sharding import parse_shard, filter_shard, shard_output_dir, merge_shard_outputs, launch_local_shards
+from src.pipeline import Pipeline, Stage
+from src.features import build_feature_matrix, save_feature_matrix, load_feature_matrix
+from src.taxonomy_index import TaxonomyIndex
+from src.tracing import profiling
 
-from utils.utils import extract_phrase_set, load_provider_settings, merge_signal_set
+from utils.utils import (
+    CONFIG_PATH, load_provider_settings, merge_signal_set,
+    save_employee_list, load_employee_list
+)
 
 # load_dotenv()
 
-def setup_employee_cluster(provider_name: str):
+EMPLOYEES_PATH = "output/employees.jsonl"
+MERGED_PATH = "output/merged_signals.json"
+VP_PATTERNS = "./output/True/pattern_results.json"
+NON_VP_PATTERNS = "./output/False/pattern_results.json"
+TAXONOMY_PATH = "./output/rules/canonical_taxonomy.json"
+STAGES = ["preprocess", "extract", "cluster", "merge", "dedup", "taxonomy", "features", "difference"]
+
+def setup_employee_cluster(provider_name: str, clustering_backend: str = "llm", llm_naming: bool = False,
+                           output_dir: str = "output", max_workers: int = 5,
+                           signal_format: str = "json", hedge: bool = False, hedge_provider: str = None):
     cfg = load_provider_settings(provider_name)
 
-    return EmployeeCluster(
+    if output_dir == "output":
+        phrase_cache = PhraseClusterCache.load_or_build()
+    else:
+        # Shards only read the global cache (launch builds it before spawning)
+        # and write their own copy
+        phrase_cache = PhraseClusterCache.load_or_build(save=False)
+        phrase_cache.path = os.path.join(output_dir, "rules", "phrase_cluster_cache.json")
+
+    employee_cluster = EmployeeCluster(
         provider=cfg["provider"],
         model=cfg["model"],
         temperature=cfg["temperature"],
-        api_key=cfg["api_key"]
+        api_key=cfg["api_key"],
+        phrase_cache=phrase_cache,
+        clustering_backend=clustering_backend,
+        llm_naming=llm_naming,
+        output_dir=output_dir,
+        max_workers=max_workers,
+        signal_format=signal_format
     )
 
-def setup_global_cluster(provider_name: str):
+    if hedge or hedge_provider:
+        # Extraction calls slower than their running p95 are re-issued (to hedge_provider if given)
+        alternate = None
+        if hedge_provider:
+            alt = load_provider_settings(hedge_provider)
+            alternate = LLMProviderFactory.create(
+                provider=alt["provider"], model=alt["model"], api_key=alt["api_key"],
+                temperature=alt["temperature"], max_tokens=employee_cluster.llm.max_tokens
+            )
+        employee_cluster.llm = HedgedLLMWrapper(employee_cluster.llm, alternate=alternate)
+
+    return employee_cluster
+
+def setup_global_cluster(provider_name: str, dedup_backend: str = "llm", llm_naming: bool = False):
     cfg = load_provider_settings(provider_name)
 
     return GlobalCluster(
         provider=cfg["provider"],
         model=cfg["model"],
         temperature=cfg["temperature"],
-        api_key=cfg["api_key"]
+        api_key=cfg["api_key"],
+        dedup_backend=dedup_backend,
+        llm_naming=llm_naming
     )
 
-def main():
-    
-    employee_cluster = setup_employee_cluster("anthropic")
-    global_cluster = setup_global_cluster("anthropic")
-
-    # print("="*60)
-    # print("Data Preprocessing")
-    # print("="*60)
-    # employee_list = aggregate_employee_data(data_dir="data")
-    # print(employee_list)
-    
-
-    # for e in tqdm(employee_list[23:]):
-    #     emp_id, result, is_vp = employee_cluster.extract_raw_signals(e)
-    #     signal_set = extract_phrase_set(result)
-    #     employee_cluster.clustering_signal(emp_id, signal_set, is_vp)
-
-    
-    # Merge Pattern results by vp flag
-    non_vp_patterns = merge_signal_set("./output/False")
-    vp_patterns = merge_signal_set("./output/True")
-
-    global_cluster.dedupligate_signals(non_vp_patterns, False)
-    global_cluster.dedupligate_signals(vp_patterns, True)
-    canonical_taxonomy = global_cluster.generate_canonical_taxonomy(vp_path='./output/True/pattern_results.json', non_vp_path='./output/False/pattern_results.json')
-    print(canonical_taxonomy)
-
-    
+def provider_params(provider_name: str):
+    # Model settings without the API key, for stage fingerprints
+    with open(CONFIG_PATH, "r") as f:
+        return {"provider": provider_name, **json.load(f).get(provider_name, {})}
+
+def run_employee_stage(employee_cluster, employee_list, cpu_pool=None):
+    # Largest employees first; chunking runs ahead in the CPU pool while the
+    # threads wait on the LLM
+    done, todo = employee_cluster.split_extracted(longest_first(employee_list))
+    chunked = prechunk_employees(todo, cpu_pool, output_dir=employee_cluster.output_dir)
+    # Employees with up-to-date keywords only need (possibly stale) clustering
+    results = chain(employee_cluster.load_extracted(done), employee_cluster.extract_all(chunked))
+
+    try:
+        # Clustering runs on its own threads so extraction keeps going
+        for _ in tqdm(employee_cluster.cluster_all(results), total=len(employee_list)):
+            pass
+    finally:
+        employee_cluster.save_phrase_cache()
+    print_hedge_stats(employee_cluster.llm)
+
+def print_hedge_stats(llm):
+    if isinstance(llm, HedgedLLMWrapper):
+        print(f"[Hedge] {llm.stats()}")
+
+def run_shard(shard: str, provider: str = "anthropic", workers: int = 5, cpu_workers: int = 1,
+              clustering_backend: str = "llm", llm_naming: bool = False,
+              signal_format: str = "json", hedge: bool = False, hedge_provider: str = None):
+    shard_index, num_shards = parse_shard(shard)
+    output_dir = shard_output_dir(shard_index, num_shards)
+
+    employee_list = aggregate_employee_data(data_dir="data", workers=cpu_workers, compact=True)
+    employee_list = filter_shard(employee_list, shard_index, num_shards)
+    print(f"Shard {shard_index}/{num_shards}: {len(employee_list)} employees -> {output_dir}")
+
+    cpu_pool = make_cpu_pool(cpu_workers) if cpu_workers > 1 else None
+    try:
+        employee_cluster = setup_employee_cluster(provider, clustering_backend=clustering_backend,
+                                                  llm_naming=llm_naming, output_dir=output_dir, max_workers=workers,
+                                                  signal_format=signal_format, hedge=hedge,
+                                                  hedge_provider=hedge_provider)
+        run_employee_stage(employee_cluster, employee_list, cpu_pool)
+    finally:
+        if cpu_pool is not None:
+            cpu_pool.shutdown()
+
+def build_pipeline(args):
+    pipeline = Pipeline()
+    model = provider_params(args.provider)
+    # The taxonomy stage is a no-op when dedup already updated it in place
+    taxonomy_updated = {"done": False}
+
+    def preprocess():
+        employee_list = aggregate_employee_data(data_dir="data", workers=args.cpu_workers, compact=True)
+        save_employee_list(employee_list, EMPLOYEES_PATH)
+
+    def extract():
+        employee_list = load_employee_list(EMPLOYEES_PATH, compact=True)
+        cpu_pool = make_cpu_pool(args.cpu_workers) if args.cpu_workers > 1 else None
+        try:
+            employee_cluster = setup_employee_cluster(args.provider, max_workers=args.workers,
+                                                      signal_format=args.signal_format,
+                                                      hedge=args.hedge, hedge_provider=args.hedge_provider)
+            _, todo = employee_cluster.split_extracted(longest_first(employee_list))
+            chunked = prechunk_employees(todo, cpu_pool, output_dir=employee_cluster.output_dir)
+            for _ in tqdm(employee_cluster.extract_all(chunked), total=len(todo)):
+                pass
+            print_hedge_stats(employee_cluster.llm)
+        finally:
+            if cpu_pool is not None:
+                cpu_pool.shutdown()
+
+    def cluster():
+        employee_cluster = setup_employee_cluster(
+            args.provider, clustering_backend=args.clustering_backend, llm_naming=args.llm_naming,
+            max_workers=args.workers
+        )
+        employees = []
+        for e in load_employee_list(EMPLOYEES_PATH, compact=True):
+            if not os.path.exists(f"output/employee_{e['rec_id']}_keywords.json"):
+                print(f"[WARN] Missing keywords for employee {e['rec_id']}")
+                continue
+            employees.append(e)
+        try:
+            for _ in tqdm(employee_cluster.cluster_all(employee_cluster.load_extracted(employees)), total=len(employees)):
+                pass
+        finally:
+            employee_cluster.save_phrase_cache()
+
+    def merge():
+        # Merge Pattern results by vp flag
+        merged = {
+            "False": sorted(merge_signal_set("./output/False")),
+            "True": sorted(merge_signal_set("./output/True")),
+        }
+        with open(MERGED_PATH, "w", encoding="utf-8") as f:
+            json.dump(merged, f, indent=2, ensure_ascii=False)
+
+    def dedup():
+        global_cluster = setup_global_cluster(args.provider, dedup_backend=args.dedup_backend, llm_naming=args.llm_naming)
+        with open(MERGED_PATH, "r", encoding="utf-8") as f:
+            merged = json.load(f)
+
+        if args.incremental and os.path.exists(TAXONOMY_PATH):
+            # Fold only new cluster names into the existing taxonomy
+            global_cluster.update_taxonomy({False: merged["False"], True: merged["True"]})
+            taxonomy_updated["done"] = True
+        else:
+            global_cluster.dedupligate_signals(merged["False"], False, max_workers=args.workers)
+            global_cluster.dedupligate_signals(merged["True"], True, max_workers=args.workers)
+
+    def taxonomy():
+        if taxonomy_updated["done"]:
+            print("Taxonomy already updated incrementally.")
+            return
+        global_cluster = setup_global_cluster(args.provider)
+        canonical_taxonomy = global_cluster.generate_canonical_taxonomy(vp_path=VP_PATTERNS, non_vp_path=NON_VP_PATTERNS)
+        print(canonical_taxonomy)
+
+    def features():
+        save_feature_matrix(build_feature_matrix(TaxonomyIndex.load()))
+
+    def difference():
+        global_cluster = setup_global_cluster(args.provider)
+        global_cluster.generate_difference_taxonomy(features=load_feature_matrix())
+
+    pipeline.add(Stage(
+        "preprocess", preprocess,
+        inputs=["data"], outputs=[EMPLOYEES_PATH],
+        params={"code": inspect.getsource(aggregate_employee_data)},
+    ))
+    pipeline.add(Stage(
+        "extract", extract, deps=["preprocess"],
+        inputs=[EMPLOYEES_PATH], outputs=["output/employee_*_keywords.json"],
+        params={
+            "prompt": inspect.getsource(EmployeeCluster._extraction_instructions) + inspect.getsource(
+                EmployeeCluster._build_extracting_signal_lines_prompt if args.signal_format == "lines"
+                else EmployeeCluster._build_extracting_signal_prompt
+            ),
+            "signal_format": args.signal_format,
+            "hedge_provider": args.hedge_provider,
+            "model": model,
+        },
+    ))
+    pipeline.add(Stage(
+        "cluster", cluster, deps=["extract"],
+        inputs=[EMPLOYEES_PATH, "output/employee_*_keywords.json"],
+        outputs=["output/*/employee_*_clustering_result.json"],
+        params={
+            "prompt": inspect.getsource(EmployeeCluster._build_cluster_prompt),
+            "naming_prompt": inspect.getsource(EmployeeCluster._build_naming_prompt),
+            "backend": args.clustering_backend,
+            "llm_naming": args.llm_naming,
+            "model": model,
+        },
+    ))
+    pipeline.add(Stage(
+        "merge", merge, deps=["cluster"],
+        inputs=["output/True/employee_*_clustering_result.json", "output/False/employee_*_clustering_result.json"],
+        outputs=[MERGED_PATH],
+    ))
+    pipeline.add(Stage(
+        "dedup", dedup, deps=["merge"],
+        inputs=[MERGED_PATH], outputs=[VP_PATTERNS, NON_VP_PATTERNS],
+        params={
+            "prompt": inspect.getsource(GlobalCluster._build_deduplicate_prompt),
+            "assign_prompt": inspect.getsource(GlobalCluster._build_assign_prompt),
+            "backend": args.dedup_backend,
+            "llm_naming": args.llm_naming,
+            "incremental": args.incremental,
+            "model": model,
+        },
+    ))
+    pipeline.add(Stage(
+        "taxonomy", taxonomy, deps=["dedup"],
+        inputs=[VP_PATTERNS, NON_VP_PATTERNS],
+        outputs=[TAXONOMY_PATH, "output/rules/taxonomy_index.json.gz"],
+    ))
+    pipeline.add(Stage(
+        "features", features, deps=["taxonomy"],
+        inputs=["output/rules/taxonomy_index.json.gz", "output/employee_*_keywords.json"],
+        outputs=["output/features/categories.json"],
+    ))
+    pipeline.add(Stage(
+        "difference", difference, deps=["features"],
+        inputs=["output/features", TAXONOMY_PATH],
+        outputs=["output/rules/difference_taxonomy.json"],
+    ))
+
+    return pipeline
+
+def add_run_options(parser):
+    parser.add_argument("--provider", default="anthropic", help="Provider block in config/llm_providers.json")
+    parser.add_argument("--stages", help=f"Comma-separated subset of: {','.join(STAGES)}")
+    parser.add_argument("--workers", type=int, default=5, help="Concurrent LLM requests")
+    parser.add_argument("--cpu-workers", type=int, default=1, help="Processes for CPU-bound preprocessing/chunking")
+    parser.add_argument("--clustering-backend", choices=["llm", "local"], default="llm")
+    parser.add_argument("--dedup-backend", choices=["llm", "local"], default="llm")
+    parser.add_argument("--llm-naming", action="store_true", help="Let the LLM name locally built clusters")
+    parser.add_argument("--signal-format", choices=["json", "lines"], default="json",
+                        help="Extraction output format; 'lines' is one award<TAB>chunk<TAB>signal line per signal")
+    parser.add_argument("--hedge", action="store_true",
+                        help="Re-issue extraction calls that run past the adaptive p95 latency")
+    parser.add_argument("--hedge-provider", help="Send hedged calls to this provider instead (implies --hedge)")
+    parser.add_argument("--full", dest="incremental", action="store_false",
+                        help="Rebuild the taxonomy from scratch instead of updating it incrementally")
+    parser.add_argument("--trace", metavar="PATH", help="Write a Chrome trace / Perfetto JSON of pipeline spans")
+    parser.add_argument("--profile", metavar="PATH", help="Write cProfile stats (.prof)")
+    parser.add_argument("--sample", metavar="PATH", help="Write sampled collapsed stacks (flamegraph format)")
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Workhuman promotion signal pipeline")
+    sub = parser.add_subparsers(dest="command", required=True)
+
+    run_parser = sub.add_parser("run", help="Run pipeline stages, skipping those whose inputs are unchanged")
+    add_run_options(run_parser)
+    run_parser.add_argument("--force", action="store_true", help="Rerun selected stages even if up to date")
+
+    status_parser = sub.add_parser("status", help="Show which stages are stale")
+    add_run_options(status_parser)
+
+    shard_parser = sub.add_parser("shard", help="Run extraction + clustering for shard i/N only (0-based i)")
+    shard_parser.add_argument("spec", metavar="i/N")
+    add_run_options(shard_parser)
+
+    launch_parser = sub.add_parser("launch", help="Run N local shard processes, merge, then the global stages")
+    launch_parser.add_argument("num_shards", type=int)
+    add_run_options(launch_parser)
+
+    merge_parser = sub.add_parser("merge-shards", help="Merge output/shards/*-of-N into output/")
+    merge_parser.add_argument("num_shards", type=int)
+
+    args = parser.parse_args(argv)
+    stages = args.stages.split(",") if getattr(args, "stages", None) else None
+
+    with profiling(getattr(args, "trace", None), getattr(args, "profile", None), getattr(args, "sample", None)):
+        if args.command == "shard":
+            run_shard(args.spec, provider=args.provider, workers=args.workers, cpu_workers=args.cpu_workers,
+                      clustering_backend=args.clustering_backend, llm_naming=args.llm_naming,
+                      signal_format=args.signal_format, hedge=args.hedge, hedge_provider=args.hedge_provider)
+
+        elif args.command == "launch":
+            # Shard processes are not traced; trace a single shard with `shard i/N --trace`
+            launch_local_shards(args.num_shards, extra_args=[
+                "--provider", args.provider, "--workers", str(args.workers), "--cpu-workers", str(args.cpu_workers),
+                "--clustering-backend", args.clustering_backend, "--signal-format", args.signal_format,
+                *(["--llm-naming"] if args.llm_naming else []),
+                *(["--hedge"] if args.hedge else []),
+                *(["--hedge-provider", args.hedge_provider] if args.hedge_provider else []),
+            ])
+            merge_shard_outputs(args.num_shards)
+            build_pipeline(args).run(stages or ["merge", "dedup", "taxonomy", "features", "difference"])
+
+        elif args.command == "merge-shards":
+            merge_shard_outputs(args.num_shards)
+
+        elif args.command == "status":
+            for name, state in build_pipeline(args).status(stages).items():
+                print(f"{name:<12} {state}")
+
+        else:
+            build_pipeline(args).run(stages, force=args.force)
+
+
 if __name__ == "__main__":
-    
+
     main()
@@ -0,0 +1,212 @@
+from array import array
+from collections.abc import Mapping, Sequence
+
+# Column-oriented employee/award storage. The pipeline code indexes
+# employees and awards like dicts (employee["awards"], award.get("title")),
+# so the stores hand out small slotted views that decode on access instead
+# of keeping one dict + two strings per award alive.
+
+AWARD_KEYS = ("title", "message")
+EMPLOYEE_KEYS = ("rec_id", "awards", "num_awards", "is_vp")
+
+
+class AwardStore:
+    """
+    All awards packed into columns: titles are interned into a pool and
+    referenced by id, messages live in one contiguous UTF-8 buffer addressed
+    by offsets.
+    """
+
+    __slots__ = ("titles", "title_ids", "buffer", "offsets", "_pool")
+
+    def __init__(self):
+        self.titles = []
+        self.title_ids = array("I")
+        self.buffer = bytearray()
+        self.offsets = array("Q", [0])
+        self._pool = {}
+
+    def append(self, title, message):
+        title_id = self._pool.get(title)
+        if title_id is None:
+            title_id = self._pool[title] = len(self.titles)
+            self.titles.append(title)
+        self.title_ids.append(title_id)
+
+        self.buffer += message.encode("utf-8")
+        self.offsets.append(len(self.buffer))
+
+    def __len__(self):
+        return len(self.title_ids)
+
+    def title(self, i):
+        return self.titles[self.title_ids[i]]
+
+    def message(self, i):
+        return self.buffer[self.offsets[i]:self.offsets[i + 1]].decode("utf-8")
+
+    @property
+    def nbytes(self):
+        return (
+            len(self.buffer)
+            + self.title_ids.itemsize * len(self.title_ids)
+            + self.offsets.itemsize * len(self.offsets)
+            + sum(len(t) for t in self.titles)
+        )
+
+
+class AwardView(Mapping):
+    __slots__ = ("_store", "_index")
+
+    def __init__(self, store, index):
+        self._store = store
+        self._index = index
+
+    def __getitem__(self, key):
+        if key == "title":
+            return self._store.title(self._index)
+        if key == "message":
+            return self._store.message(self._index)
+        raise KeyError(key)
+
+    def __iter__(self):
+        return iter(AWARD_KEYS)
+
+    def __len__(self):
+        return len(AWARD_KEYS)
+
+    def __repr__(self):
+        return repr(dict(self))
+
+
+class AwardList(Sequence):
+    """Read-only list of one employee's awards (a range of the AwardStore)."""
+
+    __slots__ = ("_store", "_start", "_stop")
+
+    def __init__(self, store, start, stop):
+        self._store = store
+        self._start = start
+        self._stop = stop
+
+    def __len__(self):
+        return self._stop - self._start
+
+    def __getitem__(self, i):
+        if isinstance(i, slice):
+            return [self[j] for j in range(*i.indices(len(self)))]
+        if i < 0:
+            i += len(self)
+        if not 0 <= i < len(self):
+            raise IndexError("award index out of range")
+        return AwardView(self._store, self._start + i)
+
+    def __iter__(self):
+        store = self._store
+        for i in range(self._start, self._stop):
+            yield AwardView(store, i)
+
+    def __repr__(self):
+        return repr(list(self))
+
+
+class CompactEmployee(Mapping):
+    """
+    Dict-like view of one employee in an EmployeeStore. Pickles as a plain
+    dict, so sending one to a worker process ships only its own awards.
+    """
+
+    __slots__ = ("_employees", "_index")
+
+    def __init__(self, employees, index):
+        self._employees = employees
+        self._index = index
+
+    def __getitem__(self, key):
+        employees, i = self._employees, self._index
+        if key == "rec_id":
+            return employees.rec_ids[i]
+        if key == "is_vp":
+            return bool(employees.is_vp[i])
+        if key == "num_awards":
+            return employees.bounds[i + 1] - employees.bounds[i]
+        if key == "awards":
+            return AwardList(employees.awards, employees.bounds[i], employees.bounds[i + 1])
+        raise KeyError(key)
+
+    def __iter__(self):
+        return iter(EMPLOYEE_KEYS)
+
+    def __len__(self):
+        return len(EMPLOYEE_KEYS)
+
+    def to_dict(self):
+        record = dict(self)
+        record["awards"] = [dict(a) for a in record["awards"]]
+        return record
+
+    def __reduce__(self):
+        return dict, (self.to_dict(),)
+
+    def __repr__(self):
+        return f"CompactEmployee(rec_id={self['rec_id']}, num_awards={self['num_awards']}, is_vp={self['is_vp']})"
+
+
+class EmployeeStore(Sequence):
+    """
+    Employee list backed by flat columns. Behaves like the list of dicts
+    returned by aggregate_employee_data: len(), indexing and iteration yield
+    CompactEmployee views.
+    """
+
+    __slots__ = ("rec_ids", "is_vp", "bounds", "awards")
+
+    def __init__(self):
+        self.rec_ids = array("q")
+        self.is_vp = bytearray()
+        self.bounds = array("Q", [0])
+        self.awards = AwardStore()
+
+    @classmethod
+    def from_records(cls, employee_list):
+        """Build from employee dicts (e.g. streamed from employees.jsonl)."""
+        store = cls()
+        for emp in employee_list:
+            store.append(
+                emp["rec_id"], emp["is_vp"],
+                ((a.get("title", ""), a.get("message", "")) for a in emp["awards"])
+            )
+        return store
+
+    def append(self, rec_id, is_vp, awards):
+        """awards is an iterable of (title, message) pairs."""
+        for title, message in awards:
+            self.awards.append(title, message)
+        self.rec_ids.append(int(rec_id))
+        self.is_vp.append(bool(is_vp))
+        self.bounds.append(len(self.awards))
+
+    def __len__(self):
+        return len(self.rec_ids)
+
+    def __getitem__(self, i):
+        if isinstance(i, slice):
+            return [self[j] for j in range(*i.indices(len(self)))]
+        if i < 0:
+            i += len(self)
+        if not 0 <= i < len(self):
+            raise IndexError("employee index out of range")
+        return CompactEmployee(self, i)
+
+    def __iter__(self):
+        for i in range(len(self)):
+            yield CompactEmployee(self, i)
+
+    @property
+    def nbytes(self):
+        return (
+            self.awards.nbytes
+            + self.rec_ids.itemsize * len(self.rec_ids)
+            + len(self.is_vp)
+            + self.bounds.itemsize * len(self.bounds)
+        )
@@ -1,5 +1,6 @@
 
 import pandas as pd
+import numpy as np
 import json
 import re
 from pathlib import Path
@@ -7,11 +8,66 @@ from typing import Tuple, List, Dict
 
 from sklearn.model_selection import train_test_split
 
+from src.parallel import make_cpu_pool, batch_ranges, shared, map_traced
+from src.tracing import tracer
+from src.compact import EmployeeStore
 
 
-def aggregate_employee_data(data_dir: str = "data"):
+
+def _employee_rows(group_range, data=None):
+    """(rec_id, is_vp, [(title, message), ...]) for each employee in group_range."""
+    data = data if data is not None else shared()
+    titles, texts, messages = data['titles'], data['texts'], data['messages']
+    bounds = data['bounds']
+
+    rows = []
+    for g in range(*group_range):
+        start, end = bounds[g], bounds[g + 1]
+        awards = [
+            (
+                str(titles[i]) if pd.notna(titles[i]) else '',
+                str(texts[i]) if pd.notna(texts[i]) else str(messages[i]),
+            )
+            for i in range(start, end)
+        ]
+        rows.append((
+            int(data['rec_ids'][g]),
+            bool(data['is_vp'][start]) if end > start else False,
+            awards,
+        ))
+
+    return rows
+
+
+def _materialize_employees(group_range, data=None):
+    return [
+        {
+            'rec_id': rec_id,
+            'awards': [{'title': title, 'message': message} for title, message in awards],
+            'num_awards': len(awards),
+            'is_vp': is_vp,
+        }
+        for rec_id, is_vp, awards in _employee_rows(group_range, data)
+    ]
+
+
+def _compact_employees(batches):
+    store = EmployeeStore()
+    for batch in batches:
+        for rec_id, is_vp, awards in batch:
+            store.append(rec_id, is_vp, awards)
+
+    return store
+
+
+def aggregate_employee_data(data_dir: str = "data", workers: int = 1, batch_size: int = 500,
+                            compact: bool = False):
     """
-    Aggregate award and history data into employee-level JSON structure
+    Aggregate award and history data into employee-level JSON structure.
+    With workers > 1 the award rows are materialized in a process pool.
+    With compact=True an EmployeeStore is returned instead (filled from the
+    same row batches): same indexing, but titles are interned and messages
+    share one text buffer.
     
     Returns:
         List of employee dicts with structure:
@@ -32,71 +88,85 @@ def aggregate_employee_data(data_dir: str = "data"):
     print("Loading raw data...")
     # control_df = pd.read_csv(data_path / "control copy.csv")
     # treatment_df = pd.read_csv(data_path / "treatment copy.csv")
-    control_df = pd.read_json(data_path / "control_clean.json")
-    treatment_df = pd.read_json(data_path / "treatment_clean.json")
-    history_df = pd.read_csv(data_path / "wh_history_full.csv")
+    with tracer.span("load", data_dir=str(data_dir)):
+        control_df = pd.read_json(data_path / "control_clean.json")
+        treatment_df = pd.read_json(data_path / "treatment_clean.json")
+        history_df = pd.read_csv(data_path / "wh_history_full.csv")
     
     # 1. Merge award data
     print("1. Merging award data (control + treatment)...")
-    award_df = pd.concat([control_df, treatment_df], ignore_index=True)
+    with tracer.span("merge") as span:
+        award_df = pd.concat([control_df, treatment_df], ignore_index=True)
+        span["rows"] = len(award_df)
    
     
     # 2. Create VP labels from history
     print("2. Creating VP labels from history...")
-    history_df['effective_start_date'] = pd.to_datetime(history_df['effective_start_date'])
-    label_df = (
-        history_df
-        .assign(is_vp=history_df['job_title'].str.contains(vp_pattern, regex=True, case=False, na=False))
-        .groupby("pk_user")['is_vp']
-        .max()
-        .reset_index()
-    )
+    with tracer.span("label", history_rows=len(history_df)):
+        history_df['effective_start_date'] = pd.to_datetime(history_df['effective_start_date'])
+        # Job titles repeat heavily; run the regex once per distinct title
+        titles = pd.Series(history_df['job_title'].dropna().unique())
+        vp_titles = set(titles[titles.str.contains(vp_pattern, regex=True, case=False)])
+        label_df = (
+            history_df
+            .assign(is_vp=history_df['job_title'].isin(vp_titles))
+            .groupby("pk_user")['is_vp']
+            .max()
+            .reset_index()
+        )
     
     
     # 3. Merge labels to award data
     print("3. Merging labels to award data...")
-    merged_df = award_df.merge(
-        label_df,
-        left_on='rec_id',
-        right_on='pk_user',
-        how='left'
-    )
-    merged_df['is_vp'] = merged_df['is_vp'].fillna(False).astype(bool)
+    with tracer.span("merge_labels"):
+        merged_df = award_df.merge(
+            label_df,
+            left_on='rec_id',
+            right_on='pk_user',
+            how='left'
+        )
+        merged_df['is_vp'] = merged_df['is_vp'].fillna(False).astype(bool)
     
     
     # 4. Aggregate by employee
     print("4. Aggregating by employee...")
-    employee_list = []
-    
-    for rec_id in merged_df['rec_id'].unique():
-        emp_awards = merged_df[merged_df['rec_id'] == rec_id]
-        
-        # Create awards list
-        awards_list = []
-        for _, row in emp_awards.iterrows():
-            award_dict = {
-                'title': str(row['title']) if pd.notna(row['title']) else '',
-                'message': str(row['text']) if pd.notna(row['text']) else str(row['message']),
-            }
-            awards_list.append(award_dict)
-        
-        # Get VP label
-        is_vp = emp_awards['is_vp'].iloc[0] if len(emp_awards) > 0 else False
-        
-        employee_list.append({
-            'rec_id': int(rec_id),
-            'awards': awards_list,
-            'num_awards': len(emp_awards),
-            'is_vp': bool(is_vp)
-        })
+    with tracer.span("aggregate", workers=workers) as span:
+        # Group rows by employee (first-seen order) once instead of filtering the
+        # whole frame per employee, then materialize award dicts in batches.
+        codes, uniques = pd.factorize(merged_df['rec_id'])
+        order = np.argsort(codes, kind='stable')
+        bounds = np.searchsorted(codes[order], np.arange(len(uniques) + 1))
+
+        messages = merged_df['message'] if 'message' in merged_df else pd.Series(np.nan, index=merged_df.index)
+        shared_data = {
+            'rec_ids': uniques.to_numpy(),
+            'bounds': bounds,
+            'titles': merged_df['title'].to_numpy(dtype=object)[order],
+            'texts': merged_df['text'].to_numpy(dtype=object)[order],
+            'messages': messages.to_numpy(dtype=object)[order],
+            'is_vp': merged_df['is_vp'].to_numpy()[order],
+        }
+
+        # The compact store is filled in this process from the row batches
+        if compact:
+            build, collect = _employee_rows, _compact_employees
+        else:
+            build, collect = _materialize_employees, lambda batches: [emp for batch in batches for emp in batch]
+
+        if workers and workers > 1 and len(uniques) > batch_size:
+            with make_cpu_pool(workers, shared_data) as pool:
+                employee_list = collect(map_traced(pool, build, batch_ranges(len(uniques), batch_size)))
+        else:
+            employee_list = collect([build((0, len(uniques)), shared_data)])
+        span["employees"] = len(employee_list)
     
-    vp_count = sum(1 for emp in employee_list if emp['is_vp'])
+    vp_count = sum(employee_list.is_vp) if compact else sum(1 for emp in employee_list if emp['is_vp'])
     print(f"   Total employees: {len(employee_list)}")
     print(f"   VP employees: {vp_count} ({vp_count/len(employee_list)*100:.1f}%)")
     
     return employee_list
 
-def split_train_data(employee_list):
+def split_train_data(employee_list, return_indices=False):
     labels = [emp["is_vp"] for emp in employee_list]
 
     train_idx, test_idx = train_test_split(
@@ -106,6 +176,9 @@ def split_train_data(employee_list):
         stratify=labels
     )
 
+    if return_indices:
+        return list(train_idx), list(test_idx)
+
     train_list = [employee_list[i] for i in train_idx]
     test_list = [employee_list[i] for i in test_idx]
 
@@ -0,0 +1,92 @@
+import os
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+import scipy.sparse as sp
+
+
+def _log_odds(hits, n):
+    # Haldane-Anscombe correction keeps zero cells finite
+    return np.log((hits + 0.5) / (n - hits + 0.5))
+
+
+def _bootstrap_log_odds(X_vp, X_non, n_reps, seed):
+    """Log-odds ratios for n_reps cohort-stratified bootstrap resamples."""
+    rng = np.random.default_rng(seed)
+    n_vp, n_non = len(X_vp), len(X_non)
+
+    # Multinomial draw counts: row weights of each resample, so every
+    # replicate is one matrix product instead of a fancy-indexed copy
+    w_vp = rng.multinomial(n_vp, np.full(n_vp, 1 / n_vp), size=n_reps).astype(np.float32)
+    w_non = rng.multinomial(n_non, np.full(n_non, 1 / n_non), size=n_reps).astype(np.float32)
+
+    return _log_odds(w_vp @ X_vp, n_vp) - _log_odds(w_non @ X_non, n_non)
+
+
+def differential_analysis(presence, labels, categories, n_boot=1000, alpha=0.05, n_jobs=None, seed=0):
+    """
+    Compare category prevalence between the VP (True) and non-VP (False) cohorts.
+
+    presence is an employees x categories matrix (dense or sparse); any
+    non-zero cell counts as the employee showing the category. Returns
+    {category: stats} ranked by log-odds ratio, with bootstrap percentile
+    confidence intervals computed in parallel across processes.
+    """
+    if sp.issparse(presence):
+        presence = presence.toarray()
+    X = (np.asarray(presence) > 0).astype(np.float32)
+    labels = np.asarray(labels, dtype=bool)
+
+    X_vp, X_non = X[labels], X[~labels]
+    n_vp, n_non = len(X_vp), len(X_non)
+    if n_vp == 0 or n_non == 0:
+        raise ValueError("Both VP and non-VP employees are required")
+
+    hits_vp = X_vp.sum(axis=0)
+    hits_non = X_non.sum(axis=0)
+    prev_vp = hits_vp / n_vp
+    prev_non = hits_non / n_non
+    lift = (hits_vp + 0.5) / (n_vp + 1) / ((hits_non + 0.5) / (n_non + 1))
+    log_odds = _log_odds(hits_vp, n_vp) - _log_odds(hits_non, n_non)
+
+    ci_low = np.full(len(categories), np.nan)
+    ci_high = np.full(len(categories), np.nan)
+
+    if n_boot:
+        n_jobs = n_jobs or os.cpu_count() or 1
+        # Worker start-up dominates small problems
+        if n_boot * len(X) < 2_000_000:
+            n_jobs = 1
+
+        seeds = np.random.SeedSequence(seed).spawn(n_jobs)
+        reps = [len(part) for part in np.array_split(np.arange(n_boot), n_jobs)]
+
+        if n_jobs == 1:
+            boot = _bootstrap_log_odds(X_vp, X_non, n_boot, seeds[0])
+        else:
+            with ProcessPoolExecutor(max_workers=n_jobs) as executor:
+                parts = executor.map(_bootstrap_log_odds, [X_vp] * n_jobs, [X_non] * n_jobs, reps, seeds)
+                boot = np.vstack(list(parts))
+
+        ci_low, ci_high = np.percentile(boot, [100 * alpha / 2, 100 * (1 - alpha / 2)], axis=0)
+
+    results = {}
+    for i in np.argsort(-log_odds, kind="stable"):
+        if ci_low[i] > 0:
+            direction = "vp"
+        elif ci_high[i] < 0:
+            direction = "non_vp"
+        else:
+            direction = "neutral"
+
+        results[categories[i]] = {
+            "vp_prevalence": round(float(prev_vp[i]), 4),
+            "non_vp_prevalence": round(float(prev_non[i]), 4),
+            "lift": round(float(lift[i]), 4),
+            "log_odds": round(float(log_odds[i]), 4),
+            "ci_low": None if np.isnan(ci_low[i]) else round(float(ci_low[i]), 4),
+            "ci_high": None if np.isnan(ci_high[i]) else round(float(ci_high[i]), 4),
+            "direction": direction,
+        }
+
+    return results
@@ -0,0 +1,178 @@
+import os, json
+from dataclasses import dataclass
+
+import numpy as np
+import scipy.sparse as sp
+from sklearn.feature_extraction.text import TfidfTransformer
+
+from src.data_preprocessor import split_train_data
+from utils.utils import read_json
+
+FEATURES_DIR = "output/features"
+_MATRICES = ("counts", "chunk_counts", "award_counts", "tfidf")
+
+
+@dataclass
+class FeatureMatrix:
+    """
+    Employee x canonical competency features (rows follow rec_ids).
+
+    counts       -- number of signals mapped to each category
+    chunk_counts -- number of distinct award chunks with the category
+    award_counts -- number of distinct awards with the category
+    tfidf        -- TF-IDF weighting of counts
+    """
+    rec_ids: np.ndarray
+    labels: np.ndarray
+    categories: list
+    counts: sp.csr_matrix
+    chunk_counts: sp.csr_matrix
+    award_counts: sp.csr_matrix
+    tfidf: sp.csr_matrix
+
+    @property
+    def employees(self):
+        return [{"rec_id": int(r), "is_vp": bool(l)} for r, l in zip(self.rec_ids, self.labels)]
+
+    def split(self, matrix="tfidf"):
+        """Stratified split via split_train_data -> (X_train, y_train, X_test, y_test)."""
+        train_idx, test_idx = split_train_data(self.employees, return_indices=True)
+        X = getattr(self, matrix)
+        return X[train_idx], self.labels[train_idx], X[test_idx], self.labels[test_idx]
+
+
+def load_employee_labels(output_dir="output"):
+    """Read is_vp labels from the output/<is_vp>/ clustering result layout."""
+    labels = {}
+    for is_vp in (True, False):
+        folder = os.path.join(output_dir, str(is_vp))
+        if not os.path.isdir(folder):
+            continue
+        for fname in os.listdir(folder):
+            if fname.startswith("employee_") and fname.endswith("_clustering_result.json"):
+                labels[int(fname[len("employee_"):-len("_clustering_result.json")])] = is_vp
+    return labels
+
+
+def build_feature_matrix(index, employees=None, output_dir="output"):
+    """
+    Map every employee's keyword signals onto the canonical taxonomy.
+
+    `employees` is a list of {'rec_id', 'is_vp'} dicts (aggregate_employee_data
+    output works as is); by default it is read from the output folder layout.
+    All signals are mapped through the index in one batched pass.
+    """
+    if employees is None:
+        employees = [{"rec_id": r, "is_vp": v} for r, v in sorted(load_employee_labels(output_dir).items())]
+
+    rec_ids = []
+    labels = []
+    phrases = []
+    rows = []
+    award_keys = []
+    chunk_keys = []
+
+    for emp in employees:
+        rec_id = emp["rec_id"]
+        path = os.path.join(output_dir, f"employee_{rec_id}_keywords.json")
+        if not os.path.exists(path):
+            print(f"[WARN] Missing keywords for employee {rec_id}")
+            continue
+
+        try:
+            signals = read_json(path, "keywords")
+        except ValueError as e:
+            print(f"[WARN] Failed to read JSON: {path} ({e})")
+            continue
+
+        row = len(rec_ids)
+        rec_ids.append(int(rec_id))
+        labels.append(bool(emp["is_vp"]))
+
+        for award_idx, chunks in signals.items():
+            if not isinstance(chunks, dict):
+                continue
+            for chunk_idx, phrase_list in chunks.items():
+                try:
+                    award_key, chunk_key = int(award_idx), int(chunk_idx)
+                except ValueError:
+                    print(f"[WARN] Skipping non-numeric key {award_idx!r}/{chunk_idx!r} for employee {rec_id}")
+                    continue
+                for phrase in phrase_list:
+                    phrases.append(phrase)
+                    rows.append(row)
+                    award_keys.append(award_key)
+                    chunk_keys.append(chunk_key)
+
+    categories = list(index.canonicals)
+    shape = (len(rec_ids), len(categories))
+
+    cols = np.array(
+        [-1 if c is None else c for c in index.lookup_many(phrases)],
+        dtype=np.int64,
+    )
+    known = cols >= 0
+    rows = np.asarray(rows, dtype=np.int64)[known]
+    cols = cols[known]
+    awards = np.asarray(award_keys, dtype=np.int64)[known]
+    chunks = np.asarray(chunk_keys, dtype=np.int64)[known]
+    print(f"Mapped {known.sum()}/{len(known)} signals onto {len(categories)} categories")
+
+    def count_unique(*keys):
+        # Count each (row, col, *keys) combination once
+        if len(rows) == 0:
+            return sp.csr_matrix(shape, dtype=np.float32)
+        combos = np.unique(np.stack([rows, cols, *keys], axis=1), axis=0)
+        ones = np.ones(len(combos), dtype=np.float32)
+        return sp.csr_matrix((ones, (combos[:, 0], combos[:, 1])), shape=shape)
+
+    counts = sp.csr_matrix(
+        (np.ones(len(rows), dtype=np.float32), (rows, cols)), shape=shape
+    )
+    counts.sum_duplicates()
+    tfidf = TfidfTransformer(sublinear_tf=True).fit_transform(counts).astype(np.float32).tocsr()
+
+    return FeatureMatrix(
+        rec_ids=np.asarray(rec_ids, dtype=np.int64),
+        labels=np.asarray(labels, dtype=bool),
+        categories=categories,
+        counts=counts,
+        chunk_counts=count_unique(awards, chunks),
+        award_counts=count_unique(awards),
+        tfidf=tfidf,
+    )
+
+
+def save_feature_matrix(features, folder=FEATURES_DIR):
+    """Write raw .npy arrays so the matrices can be memory-mapped on load."""
+    os.makedirs(folder, exist_ok=True)
+
+    np.save(os.path.join(folder, "rec_ids.npy"), features.rec_ids)
+    np.save(os.path.join(folder, "labels.npy"), features.labels)
+    for name in _MATRICES:
+        matrix = getattr(features, name)
+        for part in ("data", "indices", "indptr"):
+            np.save(os.path.join(folder, f"{name}.{part}.npy"), getattr(matrix, part))
+
+    with open(os.path.join(folder, "categories.json"), "w", encoding="utf-8") as f:
+        json.dump(features.categories, f, ensure_ascii=False)
+
+    print(f"[Saved] {folder}")
+    return folder
+
+
+def load_feature_matrix(folder=FEATURES_DIR, mmap_mode="r"):
+    with open(os.path.join(folder, "categories.json"), "r", encoding="utf-8") as f:
+        categories = json.load(f)
+
+    rec_ids = np.load(os.path.join(folder, "rec_ids.npy"), mmap_mode=mmap_mode)
+    labels = np.load(os.path.join(folder, "labels.npy"), mmap_mode=mmap_mode)
+    shape = (len(rec_ids), len(categories))
+
+    matrices = {}
+    for name in _MATRICES:
+        parts = [np.load(os.path.join(folder, f"{name}.{part}.npy"), mmap_mode=mmap_mode)
+                 for part in ("data", "indices", "indptr")]
+        matrices[name] = sp.csr_matrix(tuple(parts), shape=shape, copy=False)
+
+    return FeatureMatrix(rec_ids=rec_ids, labels=labels, categories=categories, **matrices)
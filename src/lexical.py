@@ -0,0 +1,92 @@
+import re
+from collections import Counter, defaultdict
+
+STOPWORDS = {"and", "of", "the", "for", "to", "in", "a", "an", "with", "on"}
+_TOKEN_RE = re.compile(r"[a-z0-9]+")
+
+
+def lemmatize(token):
+    """Cheap suffix-stripping lemmatizer, good enough for competency names."""
+    if len(token) <= 4:
+        return token
+    if token.endswith("ies"):
+        return token[:-3] + "y"
+    if token.endswith("ing") and len(token) > 6:
+        return token[:-3]
+    if token.endswith("s") and not token.endswith(("ss", "us", "is")):
+        return token[:-1]
+    return token
+
+
+def name_tokens(name):
+    text = str(name).lower().replace("&", " and ")
+    return [lemmatize(t) for t in _TOKEN_RE.findall(text) if t not in STOPWORDS]
+
+
+def normalize_name(name):
+    """Case, punctuation, &/and, lemma and token-order insensitive key."""
+    return " ".join(sorted(set(name_tokens(name))))
+
+
+def _trigrams(key):
+    padded = f" {key} "
+    return {padded[i:i + 3] for i in range(len(padded) - 2)}
+
+
+def group_near_duplicates(names, threshold=0.8, max_posting=200):
+    """
+    Group trivial variants of the same name.
+
+    Names are first bucketed by normalize_name. Buckets are then linked when
+    their token Jaccard or character trigram Jaccard is >= threshold, using
+    a trigram inverted index to find candidates. Returns {representative:
+    [names]}, with the shortest name of each group as its representative.
+    """
+    buckets = defaultdict(list)
+    for name in dict.fromkeys(names):
+        buckets[normalize_name(name)].append(name)
+
+    keys = list(buckets)
+    token_sets = [set(key.split()) for key in keys]
+    grams = [_trigrams(key) for key in keys]
+
+    index = defaultdict(list)
+    for i, g in enumerate(grams):
+        for gram in g:
+            index[gram].append(i)
+
+    parent = list(range(len(keys)))
+
+    def find(i):
+        while parent[i] != i:
+            parent[i] = parent[parent[i]]
+            i = parent[i]
+        return i
+
+    for i, g in enumerate(grams):
+        shared = Counter()
+        for gram in g:
+            posting = index[gram]
+            # Very common trigrams carry no signal and make this quadratic
+            if len(posting) > max_posting:
+                continue
+            for j in posting:
+                if j > i:
+                    shared[j] += 1
+
+        for j, count in shared.items():
+            gram_sim = count / (len(g) + len(grams[j]) - count)
+            union = token_sets[i] | token_sets[j]
+            token_sim = len(token_sets[i] & token_sets[j]) / len(union) if union else 0.0
+            if max(gram_sim, token_sim) >= threshold:
+                parent[find(j)] = find(i)
+
+    groups = defaultdict(list)
+    for i, key in enumerate(keys):
+        groups[find(i)].extend(buckets[key])
+
+    result = {}
+    for members in groups.values():
+        representative = min(members, key=lambda n: (len(n), n))
+        result[representative] = members
+    return result
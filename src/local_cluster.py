@@ -0,0 +1,169 @@
+import numpy as np
+import scipy.sparse as sp
+from scipy.cluster.hierarchy import fcluster, linkage
+from scipy.sparse.csgraph import connected_components
+from sklearn.cluster import HDBSCAN
+from sklearn.feature_extraction.text import TfidfVectorizer
+from sklearn.pipeline import FeatureUnion
+from sklearn.preprocessing import normalize
+
+
+class LocalClusterEngine:
+    """
+    Offline phrase clustering on CPU.
+
+    Phrases are vectorized with TF-IDF over word and character n-grams, or
+    with a local sentence-transformers model when `embedding_model` is set,
+    and grouped with average-linkage agglomerative clustering (condensed
+    cosine distances) or HDBSCAN (sparse nearest-neighbor graph). TF-IDF
+    vectors are never densified.
+    """
+
+    def __init__(self, method="agglomerative", distance_threshold=0.7, min_cluster_size=2, embedding_model=None,
+                 n_neighbors=15, block_size=1024):
+        if method not in ("agglomerative", "hdbscan"):
+            raise ValueError(f"Unknown clustering method: {method}")
+
+        self.method = method
+        self.distance_threshold = distance_threshold
+        self.min_cluster_size = min_cluster_size
+        self.embedding_model = embedding_model
+        self.n_neighbors = n_neighbors
+        self.block_size = block_size
+        self._encoder = None
+
+    def vectorize(self, phrases):
+        if self.embedding_model:
+            if self._encoder is None:
+                try:
+                    from sentence_transformers import SentenceTransformer
+                except ImportError as e:
+                    raise ImportError("sentence-transformers is required for embedding_model") from e
+                self._encoder = SentenceTransformer(self.embedding_model, device="cpu")
+            return np.asarray(self._encoder.encode(phrases, normalize_embeddings=True))
+
+        vectorizer = FeatureUnion([
+            ("word", TfidfVectorizer(analyzer="word", ngram_range=(1, 2), sublinear_tf=True)),
+            ("char", TfidfVectorizer(analyzer="char_wb", ngram_range=(3, 5), sublinear_tf=True)),
+        ])
+        # Stays sparse: a dense copy grows with phrases x n-gram vocabulary
+        return normalize(vectorizer.fit_transform(phrases)).astype(np.float32)
+
+    def _similarity_blocks(self, X):
+        """Cosine similarities of L2-normalized rows, `block_size` rows at a time."""
+        for start in range(0, X.shape[0], self.block_size):
+            sims = X[start:start + self.block_size] @ X.T
+            yield start, sims.toarray() if sp.issparse(sims) else np.asarray(sims)
+
+    def condensed_distances(self, X):
+        """Condensed (scipy pdist layout) cosine distances, without a dense X or n x n copy."""
+        n = X.shape[0]
+        condensed = np.empty(n * (n - 1) // 2)
+        for start, sims in self._similarity_blocks(X):
+            for r, row in enumerate(sims):
+                i = start + r
+                offset = i * n - i * (i + 1) // 2
+                condensed[offset:offset + n - i - 1] = 1 - row[i + 1:]
+        return np.clip(condensed, 0, 2, out=condensed)
+
+    def neighbor_graph(self, X):
+        """
+        Sparse symmetric graph of each row's `n_neighbors` nearest euclidean
+        distances (unit rows). Components are chained with the largest
+        possible distance so HDBSCAN sees one connected graph.
+        """
+        n = X.shape[0]
+        k = min(self.n_neighbors, n - 1)
+        rows, cols, dists = [], [], []
+        for start, sims in self._similarity_blocks(X):
+            # Each row keeps itself too: HDBSCAN's min_samples counts the point
+            nearest = np.argpartition(-sims, k, axis=1)[:, :k + 1]
+            block_rows = np.arange(start, start + len(sims))
+            rows.append(np.repeat(block_rows, k + 1))
+            cols.append(nearest.ravel())
+            dists.append(np.take_along_axis(sims, nearest, axis=1).ravel())
+
+        # Duplicates sit at distance 0, which a sparse matrix would drop
+        dists = np.sqrt(np.clip(2 - 2 * np.concatenate(dists), 1e-12, 4))
+        graph = sp.csr_matrix((dists, (np.concatenate(rows), np.concatenate(cols))), shape=(n, n))
+        graph = graph.maximum(graph.T)
+
+        n_components, labels = connected_components(graph, directed=False)
+        if n_components > 1:
+            heads = np.unique(labels, return_index=True)[1]
+            bridge = sp.csr_matrix((np.full(n_components - 1, 2.0), (heads[:-1], heads[1:])), shape=(n, n))
+            graph = graph.maximum(bridge).maximum(bridge.T)
+        return graph.tocsr()
+
+    def cluster(self, phrases):
+        """Return a list of phrase groups, largest first."""
+        unique = {}
+        for phrase in phrases:
+            key = " ".join(str(phrase).lower().split())
+            if key and key not in unique:
+                unique[key] = phrase
+        phrases = list(unique.values())
+
+        if len(phrases) < 2:
+            return [phrases] if phrases else []
+
+        X = self.vectorize(phrases)
+
+        if self.method == "hdbscan":
+            labels = HDBSCAN(
+                min_cluster_size=self.min_cluster_size, metric="precomputed", copy=False
+            ).fit_predict(self.neighbor_graph(X))
+        else:
+            # Average-linkage cosine merges below distance_threshold
+            tree = linkage(self.condensed_distances(X), method="average")
+            labels = fcluster(tree, t=self.distance_threshold, criterion="distance") - 1
+
+        groups = {}
+        next_label = labels.max() + 1
+        for i, label in enumerate(labels):
+            # HDBSCAN noise points become single-phrase clusters
+            if label == -1:
+                label, next_label = next_label, next_label + 1
+            groups.setdefault(label, []).append(i)
+
+        ordered = sorted(groups.values(), key=len, reverse=True)
+        return [self._order_by_centrality(X, [phrases[i] for i in idx], idx) for idx in ordered]
+
+    def _order_by_centrality(self, X, group, idx):
+        if len(idx) == 1:
+            return group
+        rows = X[idx]
+        scores = np.asarray(rows @ np.asarray(rows.mean(axis=0)).ravel()).ravel()
+        return [group[i] for i in np.argsort(-scores, kind="stable")]
+
+    def cluster_phrases(self, phrases):
+        """Cluster into the employee clustering schema {name: {phrases, description}}."""
+        results = {}
+        for group in self.cluster(phrases):
+            name = self._unique_name(group[0], results)
+            results[name] = {
+                "phrases": group,
+                "description": "Groups related behaviors such as " + ", ".join(group[:3]) + ".",
+            }
+        return results
+
+    def cluster_names(self, names):
+        """Cluster into the deduplication schema {canonical: {aliases, summary}}."""
+        results = {}
+        for group in self.cluster(names):
+            canonical = self._unique_name(group[0], results)
+            results[canonical] = {
+                "aliases": group,
+                "summary": "Consolidates " + ", ".join(group[:3]) + ".",
+            }
+        return results
+
+    @staticmethod
+    def _unique_name(phrase, taken):
+        name = phrase if any(c.isupper() for c in phrase) else phrase.title()
+        suffix = 2
+        candidate = name
+        while candidate in taken:
+            candidate = f"{name} ({suffix})"
+            suffix += 1
+        return candidate
@@ -1,3 +1,7 @@
+from src.tracing import tracer
+from utils.utils import count_tokens
+
+
 class BaseLLMWrapper:
     def __init__(self, model, api_key, temperature=0, max_tokens=4000):
         self.model = model
@@ -9,10 +13,14 @@ class BaseLLMWrapper:
         """Return a new API client every call."""
         raise NotImplementedError
 
-    def call(self, prompt: str) -> str:
-        """Return raw text output from LLM."""
-        client = self.new_client()
-        return self._invoke(client, prompt)
+    def call(self, prompt: str, site: str = None) -> str:
+        """Return raw text output from LLM. `site` names the calling step (extract, cluster, ...)."""
+        with tracer.span("llm_call", model=self.model, site=site) as span:
+            client = self.new_client()
+            raw = self._invoke(client, prompt)
+            if tracer.enabled:
+                span.update(prompt_tokens=count_tokens(prompt), response_tokens=count_tokens(raw or ""))
+            return raw
 
     def _invoke(self, client, prompt: str) -> str:
         raise NotImplementedError
\ No newline at end of file
@@ -0,0 +1,123 @@
+import time
+import threading
+from collections import defaultdict, deque
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+
+import numpy as np
+
+from src.models.base_wrapper import BaseLLMWrapper
+from src.tracing import tracer
+from utils.utils import count_tokens
+
+
+class HedgedLLMWrapper(BaseLLMWrapper):
+    """
+    Wraps a provider and re-issues a call that runs past an adaptive
+    deadline to `alternate` (or the same provider), returning whichever
+    answer arrives first. Each call site keeps its own window of recent
+    (prompt tokens, latency) samples and fits latency = fixed + per-token
+    cost to them. The deadline is that expected latency for the call's
+    prompt times the `quantile` of the observed / expected ratios, so a long
+    chunk is not hedged just for being long.
+
+    Only calls whose `site` is in `sites` are hedged; everything else goes
+    straight to the primary provider. The slower request is not cancelled
+    (the SDKs can't abort an in-flight call), so at most `max_hedges` extra
+    requests per call are paid for.
+    """
+
+    def __init__(self, primary, alternate=None, quantile=0.95, min_samples=20,
+                 initial_deadline=60.0, max_hedges=1, window=200, max_workers=32, sites=("extract",)):
+        super().__init__(model=primary.model, api_key=None,
+                         temperature=primary.temperature, max_tokens=primary.max_tokens)
+        self.primary = primary
+        self.alternate = alternate or primary
+        self.quantile = quantile
+        self.min_samples = min_samples
+        self.initial_deadline = initial_deadline
+        self.max_hedges = max_hedges
+        self.sites = set(sites)
+
+        self.latencies = defaultdict(lambda: deque(maxlen=window))
+        self.calls = 0
+        self.hedges = 0
+        self.hedge_wins = 0
+        self._lock = threading.Lock()
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="hedge")
+
+    def deadline(self, site="extract", tokens=1):
+        with self._lock:
+            samples = np.array(self.latencies[site], dtype=float)
+        if len(samples) < self.min_samples:
+            return self.initial_deadline
+
+        sizes, latencies = samples[:, 0], samples[:, 1]
+        if np.ptp(sizes) > 0:
+            per_token, fixed = np.polyfit(sizes, latencies, 1)
+            per_token = max(per_token, 0.0)
+            fixed = max(fixed, 0.0)
+        else:
+            per_token, fixed = 0.0, float(latencies.mean())
+
+        def expected(n):
+            return np.maximum(fixed + per_token * n, 1e-6)
+
+        ratios = latencies / expected(sizes)
+        return float(np.quantile(ratios, self.quantile) * expected(tokens))
+
+    def _timed_call(self, llm, prompt, site, tokens):
+        start = time.perf_counter()
+        raw = llm.call(prompt, site=site)
+        # Every finished attempt (loser included) feeds the latency estimate
+        with self._lock:
+            self.latencies[site].append((tokens, time.perf_counter() - start))
+        return raw
+
+    def call(self, prompt: str, site: str = None) -> str:
+        if site not in self.sites:
+            return self.primary.call(prompt, site=site)
+
+        with self._lock:
+            self.calls += 1
+
+        tokens = count_tokens(prompt)
+        attempts = {self._executor.submit(self._timed_call, self.primary, prompt, site, tokens): "primary"}
+        deadline = self.deadline(site, tokens)
+        errors = []
+
+        while attempts:
+            can_hedge = len(attempts) + len(errors) <= self.max_hedges
+            done, _ = wait(attempts, timeout=deadline if can_hedge else None, return_when=FIRST_COMPLETED)
+
+            if not done:
+                with tracer.span("hedge", model=self.alternate.model, site=site, deadline=round(deadline, 3)):
+                    attempts[self._executor.submit(self._timed_call, self.alternate, prompt, site, tokens)] = "hedge"
+                with self._lock:
+                    self.hedges += 1
+                continue
+
+            for future in done:
+                kind = attempts.pop(future)
+                try:
+                    raw = future.result()
+                except Exception as e:
+                    errors.append(e)
+                    continue
+                if kind == "hedge":
+                    with self._lock:
+                        self.hedge_wins += 1
+                return raw
+
+        raise errors[-1]
+
+    def stats(self):
+        return {
+            "calls": self.calls,
+            "hedges": self.hedges,
+            "hedge_wins": self.hedge_wins,
+            # Deadline (s) per 1k prompt tokens for each hedged site, None while warming up
+            "deadline_per_ktoken": {
+                site: round(self.deadline(site, 1000), 4) if len(self.latencies[site]) >= self.min_samples else None
+                for site in sorted(self.sites)
+            },
+        }
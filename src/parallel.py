@@ -0,0 +1,100 @@
+import os
+from collections import deque
+from functools import partial
+from concurrent.futures import ProcessPoolExecutor
+
+from src.tracing import tracer
+
+# CPU-bound work (award materialization, tokenization/chunking) runs in a
+# process pool so it never holds the GIL that the LLM I/O threads
+# need. Read-only inputs are handed to each worker once via the initializer
+# (inherited without copying under fork) and tasks only carry index ranges.
+# With --trace on, workers record spans on the parent's clock and tasks run
+# through _traced_call to ship them back with their results.
+
+_SHARED = {}
+
+
+def _init_worker(shared, trace_origin):
+    _SHARED.clear()
+    _SHARED.update(shared or {})
+    # Under fork the worker starts with a copy of the parent's tracer
+    if trace_origin is not None:
+        tracer.enable(origin=trace_origin)
+    else:
+        tracer.disable()
+        tracer.drain()
+
+
+def shared():
+    return _SHARED
+
+
+def default_workers():
+    return max(1, (os.cpu_count() or 1) - 1)
+
+
+def make_cpu_pool(workers=None, shared_data=None):
+    return ProcessPoolExecutor(
+        max_workers=workers or default_workers(),
+        initializer=_init_worker,
+        initargs=(shared_data, tracer.origin if tracer.enabled else None),
+    )
+
+
+def _traced_call(fn, *args):
+    return fn(*args), tracer.drain()
+
+
+def _merge_traced(packed):
+    result, spans = packed
+    tracer.merge(spans)
+    return result
+
+
+def map_traced(pool, fn, iterable):
+    """pool.map that also merges the spans the workers recorded."""
+    return map(_merge_traced, pool.map(partial(_traced_call, fn), iterable))
+
+
+def batch_ranges(total, batch_size):
+    return [(start, min(start + batch_size, total)) for start in range(0, total, batch_size)]
+
+
+def longest_first(employee_list):
+    """Order employees by award count, largest first, so the longest jobs start earliest."""
+    return sorted(employee_list, key=lambda e: e["num_awards"], reverse=True)
+
+
+def _chunk_employee(args):
+    from utils.utils import chunk_awards
+
+    employee, output_dir = args
+    return employee, chunk_awards(
+        rec_id=employee["rec_id"], awards_list=employee["awards"], output_dir=output_dir
+    )
+
+
+def _chunk_batch(employees, output_dir):
+    return [_chunk_employee((e, output_dir)) for e in employees]
+
+
+def prechunk_employees(employee_list, pool, output_dir="output", batch_size=8, window=4):
+    """
+    Tokenize and chunk employees in the CPU pool, in input order.
+
+    Yields (employee, award_chunks) lazily. At most `window` batches are
+    queued in the pool, so chunking stays a few batches ahead of the
+    caller instead of submitting every employee up front.
+    """
+    if pool is None:
+        yield from map(_chunk_employee, ((e, output_dir) for e in employee_list))
+        return
+
+    pending = deque()
+    for start, stop in batch_ranges(len(employee_list), batch_size):
+        pending.append(pool.submit(_traced_call, _chunk_batch, employee_list[start:stop], output_dir))
+        if len(pending) >= window:
+            yield from _merge_traced(pending.popleft().result())
+    while pending:
+        yield from _merge_traced(pending.popleft().result())
@@ -0,0 +1,152 @@
+import os, json
+from collections import Counter, defaultdict
+
+from utils.utils import extract_phrase_set, read_json
+
+CACHE_PATH = "output/rules/phrase_cluster_cache.json"
+DISCARDED = "__discarded__"
+
+
+def normalize_phrase(phrase):
+    return " ".join(str(phrase).lower().split())
+
+
+class PhraseClusterCache:
+    """
+    Global phrase -> cluster assignment store.
+
+    Each phrase keeps a count per cluster name it has been assigned to, and the
+    most frequent one wins. Phrases the LLM dropped are counted too, but a
+    phrase only counts as discarded (and is no longer sent) once it has been
+    dropped at least `min_discards` times and `discard_ratio` times as often
+    as it was assigned. A single reply may drop a valid phrase as a near-duplicate.
+    """
+
+    def __init__(self, path=CACHE_PATH, min_discards=3, discard_ratio=2):
+        self.path = path
+        self.min_discards = min_discards
+        self.discard_ratio = discard_ratio
+        self.assignments = defaultdict(Counter)
+        self.discarded = Counter()
+        self.descriptions = {}
+
+    @classmethod
+    def load_or_build(cls, path=CACHE_PATH, output_dir="output", save=True):
+        if os.path.exists(path):
+            return cls.load(path)
+        cache = cls.from_clustering_results(output_dir, path=path)
+        if save:
+            cache.save()
+        return cache
+
+    @classmethod
+    def load(cls, path=CACHE_PATH):
+        cache = cls(path)
+        with open(path, "r", encoding="utf-8") as f:
+            data = json.load(f)
+
+        for phrase, counts in data.get("assignments", {}).items():
+            cache.assignments[phrase].update(counts)
+        cache.discarded.update(data.get("discarded", {}))
+        cache.descriptions.update(data.get("descriptions", {}))
+        return cache
+
+    @classmethod
+    def from_clustering_results(cls, output_dir="output", path=CACHE_PATH):
+        cache = cls(path)
+
+        for is_vp in (True, False):
+            folder = os.path.join(output_dir, str(is_vp))
+            if not os.path.isdir(folder):
+                continue
+
+            for fname in sorted(os.listdir(folder)):
+                if not (fname.startswith("employee_") and fname.endswith("_clustering_result.json")):
+                    continue
+                rec_id = fname[len("employee_"):-len("_clustering_result.json")]
+
+                try:
+                    clusters = read_json(os.path.join(folder, fname), "clusters")
+                except Exception as e:
+                    print(f"[WARN] Failed to read JSON: {fname} ({e})")
+                    continue
+
+                # The keyword file holds the phrases that were sent, which
+                # tells us what the LLM discarded.
+                sent_phrases = None
+                keywords_path = os.path.join(output_dir, f"employee_{rec_id}_keywords.json")
+                if os.path.exists(keywords_path):
+                    sent_phrases = extract_phrase_set(read_json(keywords_path, "keywords"))
+
+                cache.add_result(clusters, sent_phrases)
+
+        print(f"[Cache] Built phrase cache with {len(cache.assignments)} phrases")
+        return cache
+
+    def add_result(self, clusters, sent_phrases=None):
+        seen = set()
+
+        for name, content in clusters.items():
+            if not isinstance(content, dict):
+                continue
+            if content.get("description") and name not in self.descriptions:
+                self.descriptions[name] = content["description"]
+
+            for phrase in content.get("phrases", []):
+                key = normalize_phrase(phrase)
+                self.assignments[key][name] += 1
+                seen.add(key)
+
+        for phrase in sent_phrases or []:
+            key = normalize_phrase(phrase)
+            if key not in seen:
+                self.discarded[key] += 1
+
+    def lookup(self, phrase):
+        key = normalize_phrase(phrase)
+        counts = self.assignments.get(key)
+        assigned = sum(counts.values()) if counts else 0
+        discards = self.discarded.get(key, 0)
+        if discards >= self.min_discards and discards >= self.discard_ratio * assigned:
+            return DISCARDED
+        if counts:
+            return counts.most_common(1)[0][0]
+        return None
+
+    def split(self, phrases):
+        """Return ({cluster: [phrases]}, novel_phrases) for the given phrases."""
+        known = defaultdict(list)
+        novel = []
+
+        for phrase in phrases:
+            cluster = self.lookup(phrase)
+            if cluster is None:
+                novel.append(phrase)
+            elif cluster != DISCARDED:
+                known[cluster].append(phrase)
+
+        return dict(known), novel
+
+    def build_clusters(self, known):
+        return {
+            name: {
+                "phrases": sorted(phrases),
+                "description": self.descriptions.get(name, ""),
+            }
+            for name, phrases in known.items()
+        }
+
+    def save(self):
+        os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+
+        data = {
+            "assignments": {phrase: dict(counts) for phrase, counts in self.assignments.items()},
+            "discarded": dict(self.discarded),
+            "descriptions": self.descriptions,
+        }
+        tmp_path = f"{self.path}.{os.getpid()}.tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(data, f, ensure_ascii=False)
+        os.replace(tmp_path, self.path)
+
+        return self.path
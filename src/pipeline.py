@@ -0,0 +1,160 @@
+import os, json
+import glob
+import hashlib
+
+from src.tracing import tracer
+
+STATE_PATH = "output/.pipeline_state.json"
+
+
+class Stage:
+    """
+    One pipeline step.
+
+    inputs / outputs are file paths or glob patterns. params is any
+    JSON-serializable config that should invalidate the stage when it
+    changes (prompt template text, model settings, flags).
+    """
+
+    def __init__(self, name, run, inputs=(), outputs=(), deps=(), params=None):
+        self.name = name
+        self.run = run
+        self.inputs = list(inputs)
+        self.outputs = list(outputs)
+        self.deps = list(deps)
+        self.params = params or {}
+
+
+def _expand(patterns):
+    paths = set()
+    for pattern in patterns:
+        matches = glob.glob(pattern, recursive=True)
+        for path in matches or ([pattern] if os.path.exists(pattern) else []):
+            if os.path.isdir(path):
+                for dirpath, _, filenames in os.walk(path):
+                    paths.update(os.path.join(dirpath, f) for f in filenames)
+            else:
+                paths.add(path)
+    return sorted(paths)
+
+
+def fingerprint(stage):
+    h = hashlib.sha256()
+    h.update(json.dumps(stage.params, sort_keys=True, default=str).encode("utf-8"))
+
+    for path in _expand(stage.inputs):
+        h.update(os.path.normpath(path).encode("utf-8"))
+        with open(path, "rb") as f:
+            for block in iter(lambda: f.read(1 << 20), b""):
+                h.update(block)
+
+    return h.hexdigest()
+
+
+def record_fingerprint(record, params=None):
+    """Hash of one record (e.g. an employee) plus the settings that produce its outputs."""
+    payload = json.dumps([record, params or {}], sort_keys=True, default=str, ensure_ascii=False)
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+
+def _fingerprint_path(output_path):
+    # Sidecar next to the output: employee_1_keywords.json -> employee_1_keywords.sha256
+    return os.path.splitext(output_path)[0] + ".sha256"
+
+
+def is_fresh(output_path, digest):
+    """True when output_path exists and was last written for this fingerprint."""
+    try:
+        with open(_fingerprint_path(output_path), "r", encoding="utf-8") as f:
+            return f.read().strip() == digest and os.path.exists(output_path)
+    except FileNotFoundError:
+        return False
+
+
+def mark_fresh(output_path, digest):
+    with open(_fingerprint_path(output_path), "w", encoding="utf-8") as f:
+        f.write(digest)
+
+
+def mark_stale(output_path):
+    """Drop output_path's fingerprint so the next run redoes it."""
+    try:
+        os.remove(_fingerprint_path(output_path))
+    except FileNotFoundError:
+        pass
+
+
+class Pipeline:
+    """
+    Small DAG runner. A stage is skipped when its fingerprint (inputs +
+    params) matches the last successful run and its outputs exist, so a
+    rerun only redoes what a change actually invalidates.
+    """
+
+    def __init__(self, state_path=STATE_PATH):
+        self.state_path = state_path
+        self.stages = {}
+
+    def add(self, stage):
+        for dep in stage.deps:
+            if dep not in self.stages:
+                raise ValueError(f"Stage '{stage.name}' depends on unknown stage '{dep}'")
+        self.stages[stage.name] = stage
+        return stage
+
+    def _load_state(self):
+        if not os.path.exists(self.state_path):
+            return {}
+        with open(self.state_path, "r", encoding="utf-8") as f:
+            return json.load(f)
+
+    def _save_state(self, state):
+        os.makedirs(os.path.dirname(self.state_path) or ".", exist_ok=True)
+        with open(self.state_path, "w", encoding="utf-8") as f:
+            json.dump(state, f, indent=2)
+
+    def order(self, selected=None):
+        """Topological order (insertion order is already topological)."""
+        names = list(self.stages)
+        if selected:
+            unknown = set(selected) - set(names)
+            if unknown:
+                raise ValueError(f"Unknown stages: {sorted(unknown)}")
+            names = [n for n in names if n in selected]
+        return names
+
+    def is_stale(self, name, state=None):
+        stage = self.stages[name]
+        state = self._load_state() if state is None else state
+        if state.get(name) != fingerprint(stage):
+            return True
+        return any(not _expand([pattern]) for pattern in stage.outputs)
+
+    def status(self, selected=None):
+        state = self._load_state()
+        return {name: ("stale" if self.is_stale(name, state) else "up to date") for name in self.order(selected)}
+
+    def run(self, selected=None, force=False):
+        state = self._load_state()
+        ran = []
+
+        for name in self.order(selected):
+            stage = self.stages[name]
+
+            if not force and not self.is_stale(name, state):
+                print(f"[Skip] {name}: up to date")
+                continue
+
+            print("=" * 60)
+            print(f"[Stage] {name}")
+            print("=" * 60)
+            with tracer.span(f"stage:{name}"):
+                stage.run()
+
+            # Fingerprint after running so upstream outputs written by this
+            # run are what the next run compares against
+            state[name] = fingerprint(stage)
+            self._save_state(state)
+            ran.append(name)
+
+        return ran
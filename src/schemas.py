@@ -0,0 +1,162 @@
+import json
+import typing
+from typing import Dict, List, Optional, TypedDict, Union
+
+try:
+    import msgspec
+except ImportError:
+    msgspec = None
+
+# Shapes of the LLM outputs and result files. Decoding with a schema parses
+# and validates in one pass (msgspec, a project dependency; stdlib json plus
+# a slower structural check if it is missing) and returns plain dicts/lists, so the
+# callers don't change. Validation errors are ValueErrors. LLM replies go
+# through decode_entries, which drops invalid entries one by one instead.
+
+
+class ClusterEntry(TypedDict, total=False):
+    phrases: List[str]
+    description: Optional[str]
+
+
+class PatternEntry(TypedDict, total=False):
+    aliases: List[str]
+    summary: Optional[str]
+    lineage: List[List[str]]
+
+
+class NamingEntry(TypedDict, total=False):
+    name: str
+    description: Optional[str]
+    summary: Optional[str]
+
+
+class AssignEntry(TypedDict, total=False):
+    category: str
+    # Only asked for new categories
+    summary: Optional[str]
+
+
+SCHEMAS = {
+    # {award: {chunk: [signals]}}
+    "keywords": Dict[str, Dict[str, List[str]]],
+    # {cluster: {phrases, description}}
+    "clusters": Dict[str, ClusterEntry],
+    # {canonical: {aliases, summary, lineage}}
+    "patterns": Dict[str, PatternEntry],
+    # {name: summary}
+    "taxonomy": Dict[str, str],
+    # {group_id: {name, description | summary}}
+    "names": Dict[str, NamingEntry],
+    # {name: {category, summary}}
+    "assignments": Dict[str, AssignEntry],
+}
+
+_decoders = {}
+_encoder = msgspec.json.Encoder() if msgspec is not None else None
+
+
+def _decoder(schema, part=None):
+    # part: None = whole document, "raw" = top-level object with undecoded
+    # values, "entry" = one value of the top-level object
+    key = (schema, part)
+    if key not in _decoders:
+        tp = SCHEMAS[schema] if schema else typing.Any
+        if part == "raw":
+            tp = Dict[str, msgspec.Raw]
+        elif part == "entry":
+            tp = typing.get_args(tp)[1]
+        _decoders[key] = msgspec.json.Decoder(tp)
+    return _decoders[key]
+
+
+def _check(obj, tp, path="$"):
+    if typing.get_origin(tp) is Union:
+        if obj is None and type(None) in typing.get_args(tp):
+            return
+        tp = next(arg for arg in typing.get_args(tp) if arg is not type(None))
+
+    if tp is str:
+        if not isinstance(obj, str):
+            raise ValueError(f"Expected `str`, got `{type(obj).__name__}` - at `{path}`")
+        return
+
+    origin = typing.get_origin(tp)
+    if origin is list:
+        if not isinstance(obj, list):
+            raise ValueError(f"Expected `array`, got `{type(obj).__name__}` - at `{path}`")
+        (item_tp,) = typing.get_args(tp)
+        for i, item in enumerate(obj):
+            _check(item, item_tp, f"{path}[{i}]")
+        return
+
+    if not isinstance(obj, dict):
+        raise ValueError(f"Expected `object`, got `{type(obj).__name__}` - at `{path}`")
+
+    if origin is dict:
+        _, value_tp = typing.get_args(tp)
+        for value in obj.values():
+            _check(value, value_tp, f"{path}[...]")
+        return
+
+    # TypedDict: check the declared keys, drop the rest like msgspec does
+    hints = typing.get_type_hints(tp)
+    for key in [k for k in obj if k not in hints]:
+        del obj[key]
+    for key, value_tp in hints.items():
+        if key in obj:
+            _check(obj[key], value_tp, f"{path}.{key}")
+
+
+def decode(data, schema=None):
+    """Decode JSON (str or bytes), validated against SCHEMAS[schema] if given."""
+    if msgspec is not None:
+        return _decoder(schema).decode(data)
+
+    obj = json.loads(data)
+    if schema:
+        _check(obj, SCHEMAS[schema])
+    return obj
+
+
+def decode_entries(data, schema):
+    """
+    Decode a JSON object whose values follow SCHEMAS[schema], validating each
+    entry on its own. Invalid entries are dropped with a warning, so one bad
+    value doesn't throw away the rest of an LLM reply. Raises ValueError only
+    when the reply is not a JSON object at all.
+    """
+    _, value_tp = typing.get_args(SCHEMAS[schema])
+    if msgspec is not None:
+        # Valid replies (the common case) decode in one pass
+        try:
+            return _decoder(schema).decode(data)
+        except msgspec.ValidationError:
+            pass
+        raw = _decoder(schema, "raw").decode(data)
+        value_decoder = _decoder(schema, "entry")
+    else:
+        raw = json.loads(data)
+        if not isinstance(raw, dict):
+            raise ValueError(f"Expected `object`, got `{type(raw).__name__}` - at `$`")
+
+    valid = {}
+    for key, value in raw.items():
+        try:
+            if msgspec is not None:
+                valid[key] = value_decoder.decode(value)
+            else:
+                _check(value, value_tp, f"$.{key}")
+                valid[key] = value
+        except ValueError as e:
+            print(f"[WARN] Dropped invalid {schema} entry {key!r}: {e}")
+    return valid
+
+
+def encode(obj, pretty=False):
+    """Encode to UTF-8 JSON bytes; compact unless pretty."""
+    if pretty:
+        return json.dumps(obj, indent=2, ensure_ascii=False).encode("utf-8")
+    if _encoder is not None:
+        return _encoder.encode(obj)
+    return json.dumps(obj, ensure_ascii=False, separators=(",", ":")).encode("utf-8")
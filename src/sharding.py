@@ -0,0 +1,87 @@
+import os
+import sys
+import shutil
+import hashlib
+import subprocess
+
+from src.phrase_cache import PhraseClusterCache
+
+SHARDS_DIR = "output/shards"
+
+
+def parse_shard(spec):
+    """Parse an "i/N" shard spec (0-based i) into (i, N)."""
+    try:
+        index, count = (int(part) for part in spec.split("/"))
+    except ValueError:
+        raise ValueError(f"Invalid shard spec '{spec}', expected i/N") from None
+
+    if count < 1 or not 0 <= index < count:
+        raise ValueError(f"Invalid shard spec '{spec}', need 0 <= i < N")
+    return index, count
+
+
+def shard_of(rec_id, num_shards):
+    # Stable across processes and machines, unlike hash()
+    digest = hashlib.blake2b(str(rec_id).encode("utf-8"), digest_size=8).digest()
+    return int.from_bytes(digest, "big") % num_shards
+
+
+def filter_shard(employee_list, shard_index, num_shards):
+    return [e for e in employee_list if shard_of(e["rec_id"], num_shards) == shard_index]
+
+
+def shard_output_dir(shard_index, num_shards, root=SHARDS_DIR):
+    return os.path.join(root, f"{shard_index}-of-{num_shards}")
+
+
+def merge_shard_outputs(num_shards, root=SHARDS_DIR, output_dir="output"):
+    """
+    Copy the employee outputs of shards 0..num_shards-1 (the i-of-N
+    directories; leftovers from a run with another N are ignored) into
+    output_dir, with the same layout as an unsharded run, and rebuild the
+    global phrase cache from the result. Shard-local rules/ are skipped.
+    """
+    copied = 0
+    for shard_index in range(num_shards):
+        shard_dir = shard_output_dir(shard_index, num_shards, root)
+        if not os.path.isdir(shard_dir):
+            print(f"[WARN] Folder not found: {shard_dir}")
+            continue
+
+        for dirpath, dirnames, filenames in os.walk(shard_dir):
+            rel_dir = os.path.relpath(dirpath, shard_dir)
+            if rel_dir.split(os.sep)[0] == "rules":
+                continue
+
+            target_dir = os.path.normpath(os.path.join(output_dir, rel_dir))
+            os.makedirs(target_dir, exist_ok=True)
+            for fname in filenames:
+                if fname.endswith(".tmp"):
+                    continue
+                shutil.copy2(os.path.join(dirpath, fname), os.path.join(target_dir, fname))
+                copied += 1
+
+    print(f"[Merged] {copied} files from {num_shards} shards in {root} into {output_dir}")
+
+    cache = PhraseClusterCache.from_clustering_results(output_dir)
+    cache.save()
+
+    return copied
+
+
+def launch_local_shards(num_shards, extra_args=(), script="main.py"):
+    """Run `script shard i/N` for every shard in parallel local processes."""
+    # Build the global phrase cache once up front; shards only read it
+    PhraseClusterCache.load_or_build()
+
+    procs = [
+        subprocess.Popen([sys.executable, script, "shard", f"{i}/{num_shards}", *extra_args])
+        for i in range(num_shards)
+    ]
+    codes = [p.wait() for p in procs]
+
+    failed = [i for i, code in enumerate(codes) if code != 0]
+    if failed:
+        raise RuntimeError(f"Shards failed: {failed}")
+    return codes
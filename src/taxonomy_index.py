@@ -0,0 +1,262 @@
+import os, json
+import gzip
+
+import numpy as np
+import scipy.sparse as sp
+
+from src.lexical import name_tokens, normalize_name
+
+INDEX_PATH = "output/rules/taxonomy_index.json.gz"
+_END = ""
+
+
+def _trigram_codes(keys):
+    """
+    Distinct padded character trigrams of each key as (rows, codes), with a
+    trigram packed into one int64 (three 21-bit code points).
+    """
+    padded = [f" {key} " for key in keys]
+    lengths = np.fromiter(map(len, padded), dtype=np.int64, count=len(padded))
+    chars = np.frombuffer("".join(padded).encode("utf-32-le"), dtype=np.uint32).astype(np.int64)
+
+    codes = (chars[:-2] << 42) | (chars[1:-1] << 21) | chars[2:]
+    rows = np.repeat(np.arange(len(padded)), lengths)[:len(codes)]
+    valid = np.arange(len(codes)) + 3 <= np.cumsum(lengths)[rows]
+    rows, codes = rows[valid], codes[valid]
+    if not len(rows):
+        return rows, codes
+
+    order = np.lexsort((codes, rows))
+    rows, codes = rows[order], codes[order]
+    distinct = np.r_[True, (rows[1:] != rows[:-1]) | (codes[1:] != codes[:-1])]
+    return rows[distinct], codes[distinct]
+
+
+class TaxonomyIndex:
+    """
+    Compiled phrase -> canonical category classifier.
+
+    Lookups try, in order:
+    1. exact match on the normalized (order/case/lemma-insensitive) key of
+       every canonical name, alias and clustered phrase,
+    2. the longest known phrase that is a token prefix of the query (trie),
+    3. the closest key by character trigram Jaccard (sparse key x trigram
+       matrix, scored a batch of phrases at a time).
+    """
+
+    def __init__(self, canonicals, exact, trie, fuzzy_threshold=0.5, min_prefix_tokens=2,
+                 batch_size=4096):
+        self.canonicals = canonicals
+        self.exact = exact
+        self.trie = trie
+        self.fuzzy_threshold = fuzzy_threshold
+        self.min_prefix_tokens = min_prefix_tokens
+        self.batch_size = batch_size
+        self._memo = {}
+        self._grams = None
+
+    @classmethod
+    def build(cls, vp, non_vp, phrase_cache=None, **kwargs):
+        """
+        Build from the vp / non-vp pattern_results dicts
+        ({canonical: {aliases, summary}}) and an optional PhraseClusterCache.
+        Canonical order and precedence match generate_canonical_taxonomy.
+        """
+        canonicals = []
+        ids = {}
+        entries = []
+
+        for patterns in (vp, non_vp):
+            for name, content in patterns.items():
+                if name not in ids:
+                    ids[name] = len(canonicals)
+                    canonicals.append(name)
+                entries.append((name, ids[name]))
+                aliases = content.get("aliases", []) if isinstance(content, dict) else []
+                entries.extend((alias, ids[name]) for alias in aliases)
+
+        alias_ids = {normalize_name(text): cid for text, cid in reversed(entries)}
+
+        if phrase_cache is not None:
+            # Most frequently clustered phrases claim their key first
+            ranked = sorted(phrase_cache.assignments.items(), key=lambda kv: -sum(kv[1].values()))
+            for phrase, counts in ranked:
+                cluster = counts.most_common(1)[0][0]
+                cid = alias_ids.get(normalize_name(cluster))
+                if cid is not None:
+                    entries.append((phrase, cid))
+
+        exact = {}
+        trie = {}
+        for text, cid in entries:
+            exact.setdefault(normalize_name(text), cid)
+
+            node = trie
+            for token in name_tokens(text):
+                node = node.setdefault(token, {})
+            node.setdefault(_END, cid)
+
+        return cls(canonicals, exact, trie, **kwargs)
+
+    # ---------------------------------------------------------
+    # Lookup
+    # ---------------------------------------------------------
+    def _prefix_lookup(self, tokens):
+        node = self.trie
+        best = None
+        for depth, token in enumerate(tokens, start=1):
+            node = node.get(token)
+            if node is None:
+                break
+            if _END in node and depth >= self.min_prefix_tokens:
+                best = node[_END]
+        return best
+
+    def _prefix(self, rows, cols, sizes):
+        """
+        Keep each row's `size - ceil(t * size) + 1` rarest trigrams (cols are
+        ranked rarest first, unknown trigrams are -1). Two sets with Jaccard
+        >= t always share one of these, so only the prefixes need joining.
+        Also returns each row's prefix length and rarest-last rank.
+        """
+        order = np.lexsort((cols, rows))
+        rows, cols = rows[order], cols[order]
+        starts = np.r_[0, np.cumsum(sizes)[:-1]]
+        position = np.arange(len(rows)) - starts[rows]
+        length = sizes - np.ceil(self.fuzzy_threshold * sizes - 1e-9).astype(np.int64) + 1
+        keep = position < length[rows]
+
+        last = np.full(len(sizes), -1, dtype=np.int64)
+        np.maximum.at(last, rows[keep], cols[keep])
+        keep &= cols >= 0
+        return rows[keep], cols[keep], length, last
+
+    def _matrix(self, rows, cols, num_rows):
+        num_cols = len(self._grams["vocab"])
+        return sp.csr_matrix((np.ones(len(rows), dtype=np.int32), (rows, cols)), shape=(num_rows, num_cols))
+
+    def _build_grams(self):
+        rows, codes = _trigram_codes(list(self.exact))
+        vocab, cols = np.unique(codes, return_inverse=True)
+        cols = cols.ravel()
+
+        # Rank trigrams rarest first so prefixes hold the most selective ones
+        rank = np.empty(len(vocab), dtype=np.int64)
+        rank[np.argsort(np.bincount(cols, minlength=len(vocab)), kind="stable")] = np.arange(len(vocab))
+        cols = rank[cols]
+        sizes = np.bincount(rows, minlength=len(self.exact))
+        prefix_rows, prefix_cols, length, last = self._prefix(rows, cols, sizes)
+
+        self._grams = {"vocab": vocab, "rank": rank, "sizes": sizes, "length": length, "last": last}
+        self._grams["keys"] = self._matrix(rows, cols, len(self.exact))
+        self._grams["prefix_t"] = self._matrix(prefix_rows, prefix_cols, len(self.exact)).T.tocsr()
+        self._grams["ids"] = np.fromiter(self.exact.values(), dtype=np.int64, count=len(self.exact))
+
+    def _fuzzy_lookup(self, keys):
+        """Closest key's canonical id for each key by trigram Jaccard, or None."""
+        if not self.exact:
+            return [None] * len(keys)
+        if self._grams is None:
+            self._build_grams()
+        results = []
+        for start in range(0, len(keys), self.batch_size):
+            results.extend(self._fuzzy_batch(keys[start:start + self.batch_size]))
+        return results
+
+    def _fuzzy_batch(self, keys):
+        g = self._grams
+        vocab = g["vocab"]
+
+        rows, codes = _trigram_codes(keys)
+        sizes = np.bincount(rows, minlength=len(keys))
+        found = np.searchsorted(vocab, codes).clip(max=len(vocab) - 1)
+        cols = np.where(vocab[found] == codes, g["rank"][found], -1)
+        known = cols >= 0
+        query = self._matrix(rows[known], cols[known], len(keys))
+
+        # Candidates share a prefix trigram
+        prefix_rows, prefix_cols, length, last = self._prefix(rows, cols, sizes)
+        candidates = (self._matrix(prefix_rows, prefix_cols, len(keys)) @ g["prefix_t"]).tocoo()
+        rows, cols, count = candidates.row, candidates.col, candidates.data
+        q_sizes, k_sizes = sizes[rows], g["sizes"][cols]
+
+        # Jaccard >= t needs an overlap of t / (1 + t) * (|q| + |k|). Past
+        # the shared prefixes, only the suffix of the side whose prefix ends
+        # on the rarer trigram can still overlap, which rules out most pairs
+        # before counting
+        total = q_sizes + k_sizes
+        q_ends_first = last[rows] <= g["last"][cols]
+        rest = np.where(q_ends_first, q_sizes - length[rows], k_sizes - g["length"][cols])
+        fits = (count + rest) * (1 + self.fuzzy_threshold) + 1e-9 >= self.fuzzy_threshold * total
+        rows, cols, total = rows[fits], cols[fits], total[fits]
+
+        shared = np.asarray(query[rows].multiply(g["keys"][cols]).sum(axis=1)).ravel()
+        score = shared / (total - shared)
+        hit = score >= self.fuzzy_threshold
+        rows, cols, score = rows[hit], cols[hit], score[hit]
+
+        # Best score per row, ties to the earliest key
+        order = np.lexsort((cols, -score, rows))
+        rows, cols = rows[order], cols[order]
+        first = np.r_[True, rows[1:] != rows[:-1]] if len(rows) else np.zeros(0, dtype=bool)
+
+        results = [None] * len(keys)
+        for row, col in zip(rows[first].tolist(), g["ids"][cols[first]].tolist()):
+            results[row] = col
+        return results
+
+    def lookup_many(self, phrases):
+        """Canonical ids for phrases (None if unknown); fuzzy misses are scored together."""
+        memo = self._memo
+        pending = {}
+        for phrase in phrases:
+            if phrase in memo or phrase in pending:
+                continue
+            tokens = name_tokens(phrase)
+            key = " ".join(sorted(set(tokens)))
+            cid = self.exact.get(key)
+            if cid is None and tokens:
+                cid = self._prefix_lookup(tokens)
+                if cid is None:
+                    pending[phrase] = key
+                    continue
+            memo[phrase] = cid
+
+        if pending:
+            memo.update(zip(pending, self._fuzzy_lookup(list(pending.values()))))
+        return [memo[phrase] for phrase in phrases]
+
+    def lookup(self, phrase):
+        """Return the canonical id for a phrase, or None."""
+        return self.lookup_many([phrase])[0]
+
+    def classify(self, phrases):
+        """Map each phrase to its canonical category name (None if unknown)."""
+        canonicals = self.canonicals
+        return [None if cid is None else canonicals[cid] for cid in self.lookup_many(phrases)]
+
+    # ---------------------------------------------------------
+    # Serialization
+    # ---------------------------------------------------------
+    def save(self, path=INDEX_PATH):
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+
+        data = {
+            "canonicals": self.canonicals,
+            "keys": list(self.exact),
+            "ids": list(self.exact.values()),
+            "trie": self.trie,
+        }
+        tmp_path = path + ".tmp"
+        with gzip.open(tmp_path, "wt", encoding="utf-8", compresslevel=6) as f:
+            json.dump(data, f, ensure_ascii=False, separators=(",", ":"))
+        os.replace(tmp_path, path)
+
+        print(f"[Saved] {path}")
+        return path
+
+    @classmethod
+    def load(cls, path=INDEX_PATH, **kwargs):
+        with gzip.open(path, "rt", encoding="utf-8") as f:
+            data = json.load(f)
+        return cls(data["canonicals"], dict(zip(data["keys"], data["ids"])), data["trie"], **kwargs)
@@ -0,0 +1,170 @@
+import os, json
+import sys
+import time
+import cProfile
+import threading
+import contextlib
+from collections import Counter
+
+
+class Tracer:
+    """
+    Hierarchical span recorder exported as Chrome trace / Perfetto JSON.
+
+    Spans are complete ("X") events; nesting comes from timing on the same
+    thread, so worker-thread LLM calls show up on their own tracks. Process
+    pool workers record on the parent's clock and hand their spans back with
+    drain()/merge() (see src.parallel). Disabled tracers cost one attribute
+    check per span.
+    """
+
+    def __init__(self):
+        self.enabled = False
+        self.events = []
+        self.thread_names = {}
+        self._lock = threading.Lock()
+        self._origin = time.perf_counter()
+
+    def enable(self, origin=None):
+        self.enabled = True
+        # perf_counter is system-wide monotonic, so workers can share the origin
+        self._origin = time.perf_counter() if origin is None else origin
+        self.events = []
+        self.thread_names = {}
+
+    def disable(self):
+        self.enabled = False
+
+    @property
+    def origin(self):
+        return self._origin
+
+    def drain(self):
+        """Return and clear the recorded (events, thread_names)."""
+        with self._lock:
+            drained = (self.events, self.thread_names)
+            self.events, self.thread_names = [], {}
+        return drained
+
+    def merge(self, drained):
+        """Add spans drained from another tracer (e.g. a worker process)."""
+        events, thread_names = drained
+        with self._lock:
+            self.events.extend(events)
+            self.thread_names.update(thread_names)
+
+    def _now_us(self):
+        return (time.perf_counter() - self._origin) * 1e6
+
+    @contextlib.contextmanager
+    def span(self, name, **args):
+        """Time a block. The yielded dict can be updated with more args (e.g. token counts)."""
+        if not self.enabled:
+            yield args
+            return
+
+        start = self._now_us()
+        try:
+            yield args
+        finally:
+            thread = threading.current_thread()
+            event = {
+                "name": name,
+                "ph": "X",
+                "ts": start,
+                "dur": self._now_us() - start,
+                "pid": os.getpid(),
+                "tid": thread.ident,
+                "args": args,
+            }
+            with self._lock:
+                self.events.append(event)
+                self.thread_names[(event["pid"], thread.ident)] = thread.name
+
+    def export_chrome_trace(self, path):
+        tids = {(e["pid"], e["tid"]) for e in self.events}
+        metadata = [
+            {"name": "thread_name", "ph": "M", "pid": pid, "tid": tid,
+             "args": {"name": self.thread_names.get((pid, tid), f"thread-{tid}")}}
+            for pid, tid in tids
+        ]
+
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        with open(path, "w", encoding="utf-8") as f:
+            json.dump({"traceEvents": metadata + self.events, "displayTimeUnit": "ms"}, f, default=str)
+
+        print(f"[Saved] {path} ({len(self.events)} spans)")
+        return path
+
+
+tracer = Tracer()
+
+
+class StackSampler:
+    """
+    Wall-clock sampling profiler for every thread. Writes collapsed stacks
+    ("frame;frame;frame count"), the same format py-spy and flamegraph.pl use.
+    """
+
+    def __init__(self, interval=0.005):
+        self.interval = interval
+        self.samples = Counter()
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, name="stack-sampler", daemon=True)
+
+    def _run(self):
+        own = threading.get_ident()
+        while not self._stop.wait(self.interval):
+            for tid, frame in sys._current_frames().items():
+                if tid == own:
+                    continue
+                stack = []
+                while frame is not None:
+                    code = frame.f_code
+                    stack.append(f"{code.co_name} ({os.path.basename(code.co_filename)}:{frame.f_lineno})")
+                    frame = frame.f_back
+                self.samples[";".join(reversed(stack))] += 1
+
+    def start(self):
+        self._thread.start()
+        return self
+
+    def stop(self, path):
+        self._stop.set()
+        self._thread.join()
+
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        with open(path, "w", encoding="utf-8") as f:
+            for stack, count in self.samples.most_common():
+                f.write(f"{stack} {count}\n")
+
+        print(f"[Saved] {path} ({sum(self.samples.values())} samples)")
+        return path
+
+
+@contextlib.contextmanager
+def profiling(trace_path=None, profile_path=None, sample_path=None, sample_interval=0.005):
+    """
+    Enable any combination of span tracing (Chrome trace JSON), cProfile
+    (.prof, for snakeviz / pstats) and stack sampling around a block.
+    """
+    profiler = cProfile.Profile() if profile_path else None
+    sampler = StackSampler(sample_interval).start() if sample_path else None
+    if trace_path:
+        tracer.enable()
+    if profiler:
+        profiler.enable()
+
+    try:
+        yield tracer
+    finally:
+        if profiler:
+            profiler.disable()
+            os.makedirs(os.path.dirname(profile_path) or ".", exist_ok=True)
+            profiler.dump_stats(profile_path)
+            print(f"[Saved] {profile_path}")
+        if sampler:
+            sampler.stop(sample_path)
+        if trace_path:
+            tracer.disable()
+            tracer.export_chrome_trace(trace_path)
@@ -1,15 +1,26 @@
 from typing import List, Dict, Any
+import json
 import time
+import threading
+from functools import partial
 from langchain_core.language_models import BaseLanguageModel
-from concurrent.futures import ThreadPoolExecutor
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
 
 from src.models.provider_factory import LLMProviderFactory
+from src.local_cluster import LocalClusterEngine
+from src.pipeline import record_fingerprint, is_fresh, mark_fresh, mark_stale
+from src.tracing import tracer
 
-from utils.utils import chunk_awards, parse_json_from_llm, save_employee_signals, save_clustering_result
+from utils.utils import (
+    chunk_awards, extract_phrase_set, parse_json_from_llm, parse_signal_lines, read_json, save_employee_signals,
+    save_clustering_result
+)
 
 class EmployeeCluster:
 
-    def __init__(self, provider, model, temperature, api_key):
+    def __init__(self, provider, model, temperature, api_key, phrase_cache=None,
+                 clustering_backend="llm", llm_naming=False, local_engine=None, output_dir="output",
+                 max_workers=5, signal_format="json", cache_save_every=100):
         self.llm = LLMProviderFactory.create(
             provider=provider,
             model=model,
@@ -17,79 +28,324 @@ class EmployeeCluster:
             temperature=temperature,
             max_tokens=8000
         )
+        # Optional PhraseClusterCache; known phrases are clustered locally.
+        # It is written every cache_save_every updates and by save_phrase_cache()
+        self.phrase_cache = phrase_cache
+        self.cache_save_every = cache_save_every
+        self._unsaved_updates = 0
+        # cluster_all runs clustering_signal on several threads
+        self._cache_lock = threading.RLock()
+
+        # "llm" clusters with one prompt, "local" clusters offline and only
+        # asks the LLM to name the clusters when llm_naming is set
+        if clustering_backend not in ("llm", "local"):
+            raise ValueError(f"Unknown clustering backend: {clustering_backend}")
+        self.clustering_backend = clustering_backend
+        self.llm_naming = llm_naming
+        self.local_engine = local_engine or LocalClusterEngine()
+        self.output_dir = output_dir
+        self.max_workers = max_workers
+
+        # "json" asks for the nested {award: {chunk: [signals]}} object,
+        # "lines" for one award<TAB>chunk<TAB>signal line per signal (fewer output tokens)
+        if signal_format not in ("json", "lines"):
+            raise ValueError(f"Unknown signal format: {signal_format}")
+        self.signal_format = signal_format
+
+    # -------------------------
+    # Per-employee fingerprints
+    # -------------------------
+    # Each keywords / clustering file has a .sha256 sidecar with the hash of
+    # the employee's input and the prompt/model settings that produced it,
+    # so reruns only redo the employees whose input or settings changed.
+    def _keywords_path(self, rec_id):
+        return f"{self.output_dir}/employee_{rec_id}_keywords.json"
+
+    def _clusters_path(self, rec_id, is_vp):
+        return f"{self.output_dir}/{is_vp}/employee_{rec_id}_clustering_result.json"
+
+    def _settings(self):
+        return {"model": self.llm.model, "temperature": self.llm.temperature}
+
+    def extraction_fingerprint(self, employee):
+        build_prompt = (self._build_extracting_signal_lines_prompt if self.signal_format == "lines"
+                        else self._build_extracting_signal_prompt)
+        record = {
+            "rec_id": employee["rec_id"],
+            "is_vp": employee["is_vp"],
+            "awards": [[a.get("title", ""), a.get("message", "")] for a in employee["awards"]],
+        }
+        return record_fingerprint(record, {"prompt": build_prompt(""), **self._settings()})
+
+    def clustering_fingerprint(self, rec_id, signal_set, is_vp):
+        record = {"rec_id": rec_id, "is_vp": is_vp, "phrases": sorted(signal_set)}
+        return record_fingerprint(record, {
+            "prompt": self._build_cluster_prompt([]),
+            "naming_prompt": self._build_naming_prompt({}),
+            "backend": self.clustering_backend,
+            "llm_naming": self.llm_naming,
+            **self._settings(),
+        })
+
+    def split_extracted(self, employee_list):
+        """Return (done, todo): employees whose keywords are up to date, and the rest."""
+        done, todo = [], []
+        for employee in employee_list:
+            fresh = is_fresh(self._keywords_path(employee["rec_id"]), self.extraction_fingerprint(employee))
+            (done if fresh else todo).append(employee)
+        if done:
+            print(f"[Skip] {len(done)} employees with up-to-date keywords")
+        return done, todo
+
+    def load_extracted(self, employees):
+        """Yield (rec_id, results, is_vp) from saved keywords, like extract_all."""
+        for employee in employees:
+            rec_id = employee["rec_id"]
+            yield rec_id, read_json(self._keywords_path(rec_id), "keywords"), employee["is_vp"]
 
     # -------------------------
     # STEP 1: Award Chunk Summaries
     # -------------------------
-    def extract_raw_signals(self, employee) -> str:
+    def extract_raw_signals(self, employee, award_chunks=None) -> str:
+        with tracer.span("extract", rec_id=employee.get("rec_id")):
+            return list(self.extract_all([(employee, award_chunks)]))[0]
+
+    def extract_all(self, chunked, max_in_flight=None):
+        """
+        Extract signals for a stream of (employee, award_chunks) pairs over one
+        shared thread pool, yielding (rec_id, results, is_vp) as each employee
+        finishes. Chunks are dispatched in input order, largest chunk of each
+        employee first, so feeding employees longest-first (see longest_first)
+        starts the long jobs while short ones fill the idle threads.
+
+        At most max_in_flight chunks (default 2 x max_workers) are queued
+        before the next employee is pulled from `chunked`.
+        """
+        max_in_flight = max_in_flight or 2 * self.max_workers
+        source = iter(chunked)
+        futures = {}
+
+        with ThreadPoolExecutor(max_workers=self.max_workers) as executor:
+            while True:
+                while len(futures) < max_in_flight:
+                    item = next(source, None)
+                    if item is None:
+                        break
+                    employee, award_chunks = item
+                    rec_id = employee.get("rec_id")
+
+                    # Callers may pre-chunk in a process pool (see prechunk_employees)
+                    if award_chunks is None:
+                        award_chunks = chunk_awards(rec_id=rec_id, awards_list=employee.get("awards"), output_dir=self.output_dir)
+
+                    job = {"employee": employee, "results": [None] * len(award_chunks),
+                           "pending": len(award_chunks), "start": time.time()}
+                    if not award_chunks:
+                        yield self._finish_extraction(job)
+                        continue
+
+                    for idx in sorted(range(len(award_chunks)), key=lambda i: -len(award_chunks[i])):
+                        futures[executor.submit(self._extract_chunk, rec_id, idx, award_chunks[idx])] = (job, idx)
+
+                if not futures:
+                    break
+
+                done, _ = wait(futures, return_when=FIRST_COMPLETED)
+                for future in done:
+                    job, idx = futures.pop(future)
+                    job["results"][idx] = future.result()
+                    job["pending"] -= 1
+                    if job["pending"] == 0:
+                        yield self._finish_extraction(job)
+
+    def _extract_chunk(self, rec_id, chunk_index, chunk_text):
+        if self.signal_format == "lines":
+            build_prompt, parse = self._build_extracting_signal_lines_prompt, parse_signal_lines
+        else:
+            build_prompt, parse = self._build_extracting_signal_prompt, partial(parse_json_from_llm, schema="keywords")
+
+        with tracer.span("extract_chunk", rec_id=rec_id, chunk_index=chunk_index, format=self.signal_format):
+            prompt = build_prompt(chunk_text)
+            raw = self.llm.call(prompt, site="extract")
+
+            with tracer.span("parse", rec_id=rec_id, chunk_index=chunk_index, chars=len(raw or "")):
+                try:
+                    return parse(raw)
+                except Exception as e:
+                    # None marks the chunk as failed so the employee is retried next run
+                    print("JSON PARSE ERROR:", e)
+                    return None
+
+    def _finish_extraction(self, job):
+        employee, results = job["employee"], job["results"]
         rec_id = employee.get("rec_id")
-        awards = employee.get("awards")
         is_vp = employee.get("is_vp")
 
-        award_chunks = chunk_awards(rec_id=rec_id, awards_list=awards)
-
-        def process_chunk(chunk_text):
-            prompt = self._build_extracting_signal_prompt(chunk_text)
-            raw = self.llm.call(prompt)
-            
-
-            try:
-                return parse_json_from_llm(raw)
-            except Exception as e:
-                print("JSON PARSE ERROR:", e)
-                return {} 
-
-
-        start = time.time()
-
-        with ThreadPoolExecutor(max_workers=5) as executor:
-            results = executor.map(process_chunk, award_chunks)
-
-        print(f"TOTAL TIME: {time.time() - start:.2f} seconds")
+        print(f"[Extract] employee {rec_id}: {len(results)} chunks in {time.time() - job['start']:.2f}s")
 
+        # Chunk replies are already validated per award (invalid awards dropped)
         all_results = {}
-        signal_set = set()
-
-        for id, r in enumerate(results):
-            # skip invalid or empty
-            if not r or not isinstance(r, dict):
-                continue
-
-            for award_index, sentence_dict in r.items():
-                award_index = str(award_index)
-
-                if not isinstance(sentence_dict, dict):
-                    print(f"[WARN] Invalid sentence_dict for award {award_index}: {sentence_dict}")
-                    continue
-
-                all_results[award_index] = sentence_dict
-
-        save_employee_signals(rec_id=rec_id, results=all_results)
-
-        for award_index, sentence_dict in all_results.items():
-            for sentence_index, signals in sentence_dict.items():
-                for s in signals:
-                    signal_set.add(s)
-
+        for r in results:
+            if r:
+                all_results.update(r)
+
+        failed = sum(r is None for r in results)
+        with tracer.span("save", rec_id=rec_id, kind="keywords"):
+            save_path = save_employee_signals(rec_id=rec_id, results=all_results, folder=self.output_dir)
+            if failed:
+                print(f"[WARN] employee {rec_id}: {failed} chunks failed to parse, will retry next run")
+                mark_stale(save_path)
+            else:
+                mark_fresh(save_path, self.extraction_fingerprint(employee))
 
         return rec_id, all_results, is_vp
 
 
-
-
     def clustering_signal(self, rec_id, signal_set, is_vp):
-        prompt = self._build_cluster_prompt(signal_set)
-        raw = self.llm.call(prompt)
+        with tracer.span("cluster", rec_id=rec_id, phrases=len(signal_set), backend=self.clustering_backend) as span:
+            digest = self.clustering_fingerprint(rec_id, signal_set, is_vp)
+            if is_fresh(self._clusters_path(rec_id, is_vp), digest):
+                span["skipped"] = True
+                return read_json(self._clusters_path(rec_id, is_vp), "clusters")
+
+            known = {}
+
+            if self.phrase_cache is not None:
+                with self._cache_lock:
+                    known, signal_set = self.phrase_cache.split(signal_set)
+                span.update(cache_hits=sum(len(v) for v in known.values()), novel=len(signal_set))
+
+                if not signal_set:
+                    with self._cache_lock:
+                        parsed_json = self.phrase_cache.build_clusters(known)
+                    with tracer.span("save", rec_id=rec_id, kind="clusters"):
+                        save_path = save_clustering_result(rec_id=rec_id, results=parsed_json, is_vp=is_vp, folder=self.output_dir)
+                        mark_fresh(save_path, digest)
+                    return parsed_json
+
+                print(f"[Cache] {len(signal_set)} novel phrases sent to LLM")
+
+            if self.clustering_backend == "local":
+                parsed_json, cacheable = self._cluster_locally(signal_set)
+            else:
+                prompt = self._build_cluster_prompt(signal_set)
+                raw = self.llm.call(prompt, site="cluster")
+
+                with tracer.span("parse", rec_id=rec_id, chars=len(raw or "")):
+                    try:
+                        parsed_json = parse_json_from_llm(raw, schema="clusters")
+                    except Exception as e:
+                        print("JSON PARSE ERROR:", e)
+                        parsed_json = None
+                cacheable = parsed_json
+
+            # None means the clustering reply was unusable: save what we have, retry next run
+            failed = cacheable is None
+            if failed:
+                parsed_json = parsed_json or {}
+
+            if self.phrase_cache is not None:
+                with self._cache_lock:
+                    if cacheable:
+                        # The local backend keeps every phrase, so nothing it
+                        # leaves out counts as discarded
+                        sent_phrases = signal_set if self.clustering_backend == "llm" else None
+                        self.phrase_cache.add_result(cacheable, sent_phrases=sent_phrases)
+                        self._unsaved_updates += 1
+                        if self._unsaved_updates >= self.cache_save_every:
+                            self.save_phrase_cache()
+                    known_clusters = self.phrase_cache.build_clusters(known)
+
+                for name, content in known_clusters.items():
+                    if name in parsed_json and isinstance(parsed_json[name], dict):
+                        merged = set(parsed_json[name].get("phrases", [])) | set(content["phrases"])
+                        parsed_json[name]["phrases"] = sorted(merged)
+                    else:
+                        parsed_json[name] = content
+
+            span["clusters"] = len(parsed_json)
+            with tracer.span("save", rec_id=rec_id, kind="clusters"):
+                save_path = save_clustering_result(rec_id=rec_id, results=parsed_json, is_vp=is_vp, folder=self.output_dir)
+                if failed:
+                    mark_stale(save_path)
+                else:
+                    mark_fresh(save_path, digest)
+
+            return parsed_json
+
+    def cluster_all(self, extracted, max_in_flight=None):
+        """
+        Run clustering_signal for a stream of (rec_id, results, is_vp), e.g.
+        from extract_all, on a separate thread pool and yield (rec_id, clusters)
+        as each employee finishes. The stream keeps being pulled while
+        clustering calls wait on the LLM, so extraction never stalls on them.
+
+        At most max_in_flight employees (default 2 x max_workers) are clustering
+        at once before the next one is pulled from `extracted`.
+        """
+        max_in_flight = max_in_flight or 2 * self.max_workers
+        source = iter(extracted)
+        futures = {}
+
+        with ThreadPoolExecutor(max_workers=self.max_workers, thread_name_prefix="cluster") as executor:
+            while True:
+                while len(futures) < max_in_flight:
+                    item = next(source, None)
+                    if item is None:
+                        break
+                    rec_id, results, is_vp = item
+                    futures[executor.submit(self.clustering_signal, rec_id, extract_phrase_set(results), is_vp)] = rec_id
+
+                if not futures:
+                    break
+
+                done, _ = wait(futures, return_when=FIRST_COMPLETED)
+                for future in done:
+                    yield futures.pop(future), future.result()
+
+    def save_phrase_cache(self):
+        with self._cache_lock:
+            if self.phrase_cache is not None and self._unsaved_updates:
+                self.phrase_cache.save()
+                self._unsaved_updates = 0
+
+    def _cluster_locally(self, signal_set):
+        """
+        Return (clusters, llm_named). Only the LLM-named clusters go into the
+        phrase cache; local group names are just the most central phrase.
+        llm_named is None when the naming reply could not be parsed.
+        """
+        clusters = self.local_engine.cluster_phrases(signal_set)
+        if not self.llm_naming or not clusters:
+            return clusters, {}
+
+        groups = {str(i): content["phrases"] for i, content in enumerate(clusters.values())}
+        raw = self.llm.call(self._build_naming_prompt(groups), site="naming")
 
         try:
-            parsed_json = parse_json_from_llm(raw)
+            names = parse_json_from_llm(raw, schema="names")
         except Exception as e:
             print("JSON PARSE ERROR:", e)
-            prased_json = {}
-
-        save_clustering_result(rec_id=rec_id, results=parsed_json, is_vp=is_vp)
+            return clusters, None
+
+        named = {}
+        llm_named = set()
+        for (local_name, content), idx in zip(clusters.items(), groups):
+            entry = names.get(idx) if isinstance(names, dict) else None
+            if not isinstance(entry, dict) or not entry.get("name"):
+                named[local_name] = content
+                continue
+            name = entry["name"]
+            llm_named.add(name)
+            if name in named:
+                named[name]["phrases"] = named[name]["phrases"] + content["phrases"]
+                continue
+            named[name] = {
+                "phrases": content["phrases"],
+                "description": entry.get("description") or content["description"],
+            }
 
-        return parsed_json
+        return named, {name: named[name] for name in llm_named}
 
    
 
@@ -97,9 +353,9 @@ class EmployeeCluster:
     # PROMPT BUILDERS
     # ========================================================
 
-    # STEP 1 Prompt ------------------------------------------
-    def _build_extracting_signal_prompt(self, chunk_text):
-        return f"""
+    # STEP 1 Prompt, shared by both output formats ----------
+    def _extraction_instructions(self):
+        return """
                 You will analyze multiple award entries from a single employee.
 
                 Each award entry follows the format:
@@ -119,7 +375,7 @@ class EmployeeCluster:
                 - A chunk may span part of a sentence, a full sentence, or multiple sentences.
                 3. Chunk order is preserved.
 
-                Chunking is internal only and should NOT appear in the final JSON.
+                Chunking is internal only and should NOT appear in the output.
 
                 --------------------------------------------------------
                 STEP 2 — PHRASE-LEVEL SIGNAL CANDIDATES
@@ -173,7 +429,11 @@ class EmployeeCluster:
                 - chunk_index "1", "2", ... = semantic chunks from the message.
 
                 If a chunk produces 0 signals → omit that chunk entirely.
+"""
 
+    # STEP 1 Prompt ------------------------------------------
+    def _build_extracting_signal_prompt(self, chunk_text):
+        return f"""{self._extraction_instructions()}
                 --------------------------------------------------------
                 STEP 5 — OUTPUT SPECIFICATION
                 --------------------------------------------------------
@@ -249,6 +509,68 @@ class EmployeeCluster:
             """
 
     
+    # STEP 1 Prompt, compact line output (signal_format="lines") -----
+    def _build_extracting_signal_lines_prompt(self, chunk_text):
+        return f"""{self._extraction_instructions()}
+                --------------------------------------------------------
+                STEP 5 — OUTPUT SPECIFICATION
+                --------------------------------------------------------
+                Output ONE LINE PER SIGNAL, tab-separated:
+
+                <award_index>\t<chunk_index>\t<signal>
+
+                - Use a single TAB character between the three fields.
+                - Several signals from the same chunk go on separate lines.
+                - Chunks and awards with 0 signals produce no lines.
+                - Do NOT output JSON, headers, quotes, numbering, code fences,
+                  explanation, commentary, or chunk content.
+
+                --------------------------------------------------------
+                FEW-SHOT EXAMPLES (STRICTLY FOLLOW THIS BEHAVIOR)
+                --------------------------------------------------------
+
+                Example Input:
+                0# Innovation Spotlight | She created a new automation. It saved 40 hours. The change was well received.
+
+                Example Output:
+                0\t0\tinnovation
+                0\t1\tprocess automation
+                0\t2\tefficiency improvement
+
+                Explanation: “well received” is discarded because it is not VP-relevant.
+
+                --------------------------------------------------------
+
+                Example Input:
+                0# Recognition Award | Thank you for your hard work. You always give your best.
+
+                Example Output:
+                0\t2\tdedication
+
+                Explanation:
+                - Title not meaningful → skip.
+                - Sentence 1 → no promotable meaning → skip.
+                - Sentence 2 → “dedication” is meaningful → keep.
+
+                --------------------------------------------------------
+
+                Example Input:
+                0# Team Leadership Award | She led a cross-functional migration effort. She coordinated directors and ICs across multiple regions.
+
+                Example Output:
+                0\t0\tleadership
+                0\t1\tcross-functional leadership
+                0\t2\tmulti-level coordination
+
+                --------------------------------------------------------
+
+                NOW PROCESS THE FOLLOWING AWARDS:
+                {chunk_text}
+
+                Return ONLY the signal lines.
+            """
+
+    
     def _build_cluster_prompt(self, phrase_list):
         
 
@@ -361,4 +683,31 @@ class EmployeeCluster:
             {phrase_list}
 
             Return ONLY the JSON object. No commentary.
-            """
\ No newline at end of file
+            """
+
+    def _build_naming_prompt(self, groups):
+        return f"""
+            You are given groups of behavior phrases that were already clustered.
+            Do NOT move phrases between groups and do NOT merge or split groups.
+
+            For each group:
+            - Create a short (1–4 word) descriptive cluster name at the
+              VP/leadership competency level.
+            - Write a one-sentence description of the behavior and why it
+              matters for senior leadership / VP roles.
+
+            Return a single JSON object keyed by the group id:
+
+            {{
+            "<group_id>": {{
+                "name": "...",
+                "description": "One-sentence explanation"
+            }},
+            ...
+            }}
+
+            GROUPS:
+            {json.dumps(groups, ensure_ascii=False, indent=1)}
+
+            Return ONLY the JSON object. No commentary.
+            """
@@ -3,12 +3,22 @@ import json
 from concurrent.futures import ThreadPoolExecutor
 
 from src.models.provider_factory import LLMProviderFactory
-
-from utils.utils import parse_json_from_llm, save_final_result, save_taxonomy
+from src.local_cluster import LocalClusterEngine
+from src.lexical import group_near_duplicates, normalize_name
+from src.phrase_cache import PhraseClusterCache
+from src.taxonomy_index import TaxonomyIndex
+from src.features import build_feature_matrix
+from src.differential import differential_analysis
+from src.tracing import tracer
+
+from utils.utils import (
+    parse_json_from_llm, read_json, save_final_result, save_taxonomy, save_difference_taxonomy, bump_taxonomy_version
+)
 
 class GlobalCluster:
 
-    def __init__(self, provider, model, temperature, api_key):
+    def __init__(self, provider, model, temperature, api_key,
+                 dedup_backend="llm", llm_naming=False, local_engine=None):
         self.llm = LLMProviderFactory.create(
             provider=provider,
             model=model,
@@ -16,47 +26,196 @@ class GlobalCluster:
             temperature=temperature,
             max_tokens=4000
         )
+
+        # "llm" deduplicates with one prompt, "local" clusters names offline
+        # and only asks the LLM to name the groups when llm_naming is set
+        if dedup_backend not in ("llm", "local"):
+            raise ValueError(f"Unknown dedup backend: {dedup_backend}")
+        self.dedup_backend = dedup_backend
+        self.llm_naming = llm_naming
+        self.local_engine = local_engine or LocalClusterEngine(distance_threshold=0.75)
     
-    def dedupligate_signals(self, signal_list, is_vp):
+    def dedupligate_signals(self, signal_list, is_vp, shard_size=120, max_workers=5, max_rounds=6):
         print(f"Deduplicating process...")
-        prompt = self._build_deduplicate_prompt(signal_list)
-        raw = self.llm.call(prompt)
-        # print(" response:", raw)
+        signal_list = sorted(set(signal_list))
 
-        try:
-            parsed_json =  parse_json_from_llm(raw)
-        except Exception as e:
-            print("JSON PARSE ERROR:", e)
-            parsed_json = {}
+        with tracer.span("dedup", is_vp=is_vp, names=len(signal_list), backend=self.dedup_backend) as span:
+            if self.dedup_backend == "local":
+                parsed_json = self._deduplicate_locally(signal_list)
+            else:
+                parsed_json = self._deduplicate_sharded(signal_list, shard_size, max_workers, max_rounds)
+            span["canonicals"] = len(parsed_json)
 
-        save_final_result(parsed_json, is_vp)
+        with tracer.span("save", kind="pattern_results", is_vp=is_vp):
+            save_final_result(parsed_json, is_vp)
 
         return 
 
-    def generate_difference_taxonomy(self, vp_path, non_vp_path):
-        with open(vp_path, "r", encoding="utf-8") as f:
-            vp = json.load(f)
-        with open(non_vp_path, "r", encoding="utf-8") as f:
-            non_vp = json.load(f)
+    def _deduplicate_with_llm(self, signal_list):
+        with tracer.span("dedup_shard", names=len(signal_list)):
+            prompt = self._build_deduplicate_prompt(signal_list)
+            raw = self.llm.call(prompt)
+            # print(" response:", raw)
+
+            with tracer.span("parse", chars=len(raw or "")):
+                try:
+                    parsed_json =  parse_json_from_llm(raw, schema="patterns")
+                except Exception as e:
+                    print("JSON PARSE ERROR:", e)
+                    parsed_json = {}
+
+        return parsed_json if isinstance(parsed_json, dict) else {}
+
+    def _make_shards(self, names, shard_size, round_idx=0):
+        # Sort on the normalized token bag so lexically similar names
+        # ("Vision & Planning" / "Vision & Strategy") share a shard
+        ordered = sorted(names, key=lambda n: (normalize_name(n), n))
+        num_shards = -(-len(ordered) // shard_size)
+
+        if round_idx == 0 or num_shards == 1:
+            return [ordered[i:i + shard_size] for i in range(0, len(ordered), shard_size)]
 
-        prompt = self._build_difference_prompt(vp, non_vp)
-        raw = self.llm.call(prompt)
-        # print(" response:", raw)
+        # Later rounds stride across the ordering so canonicals that were
+        # kept apart in the previous round meet in a shard
+        return [ordered[i::num_shards] for i in range(num_shards)]
+
+    def _deduplicate_sharded(self, signal_list, shard_size, max_workers, max_rounds):
+        """
+        Map-reduce deduplication: shards of names are deduplicated in
+        parallel, then the shard canonicals are deduplicated again until a
+        single shard (or no further reduction) remains.
+
+        Trivial lexical variants are collapsed locally first, so only one
+        representative per group reaches the LLM.
+        """
+        with tracer.span("lexical_prepass", names=len(signal_list)):
+            lexical_groups = group_near_duplicates(signal_list)
+        print(f"Lexical pre-pass: {len(signal_list)} names -> {len(lexical_groups)} representatives")
+
+        originals = {rep: sorted(members) for rep, members in lexical_groups.items()}
+        summaries = {}
+        rounds = [lexical_groups]
+        current = list(lexical_groups)
+
+        for round_idx in range(max_rounds):
+            if len(current) <= 1:
+                break
+            shards = self._make_shards(current, shard_size, round_idx)
+            print(f"Round {round_idx + 1}: {len(current)} names in {len(shards)} shard(s)")
+
+            with tracer.span("dedup_round", round=round_idx + 1, names=len(current), shards=len(shards)):
+                with ThreadPoolExecutor(max_workers=max_workers) as executor:
+                    results = list(executor.map(self._deduplicate_with_llm, shards))
+
+            children = {}
+            for shard, result in zip(shards, results):
+                shard_names = set(shard)
+                assigned = set()
+
+                for canonical, content in result.items():
+                    if not isinstance(content, dict):
+                        continue
+                    aliases = [a for a in content.get("aliases", []) if a in shard_names]
+                    if canonical in shard_names:
+                        aliases.append(canonical)
+                    aliases = [a for a in dict.fromkeys(aliases) if a not in assigned]
+                    if not aliases:
+                        continue
+
+                    assigned.update(aliases)
+                    children.setdefault(canonical, []).extend(aliases)
+                    if content.get("summary"):
+                        summaries[canonical] = content["summary"]
+
+                # Names the model dropped survive as their own canonical
+                for name in shard:
+                    if name not in assigned:
+                        children.setdefault(name, []).append(name)
+
+            rounds.append(children)
+            originals = {
+                canonical: sorted({o for child in merged for o in originals[child]})
+                for canonical, merged in children.items()
+            }
+            # Stable once everything fit in one prompt or a round merged < 5%
+            converged = len(shards) == 1 or len(children) > 0.95 * len(current)
+            current = list(children)
+
+            if converged:
+                break
+
+        parsed_json = {}
+        for canonical in current:
+            lineage = []
+            level = [canonical]
+            for children in reversed(rounds):
+                level = sorted({child for name in level for child in children.get(name, [name])})
+                if not lineage or lineage[-1] != level:
+                    lineage.append(level)
+
+            parsed_json[canonical] = {
+                "aliases": originals[canonical],
+                "summary": summaries.get(canonical, ""),
+                "lineage": list(reversed(lineage)),
+            }
+
+        return parsed_json
+
+    def _deduplicate_locally(self, signal_list):
+        groups = self.local_engine.cluster_names(signal_list)
+        if not self.llm_naming or not groups:
+            return groups
+
+        indexed = {str(i): content["aliases"] for i, content in enumerate(groups.values())}
+        raw = self.llm.call(self._build_naming_prompt(indexed))
 
         try:
-            parsed_json =  parse_json_from_llm(raw)
+            names = parse_json_from_llm(raw, schema="names")
         except Exception as e:
             print("JSON PARSE ERROR:", e)
-            parsed_json = {}
+            return groups
 
-        
+        named = {}
+        for (local_name, content), idx in zip(groups.items(), indexed):
+            entry = names.get(idx) if isinstance(names, dict) else None
+            if not isinstance(entry, dict) or not entry.get("name"):
+                named[local_name] = content
+                continue
+            name = entry["name"]
+            if name in named:
+                named[name]["aliases"] = named[name]["aliases"] + content["aliases"]
+                continue
+            named[name] = {
+                "aliases": content["aliases"],
+                "summary": entry.get("summary") or content["summary"],
+            }
+
+        return named
+
+    def generate_difference_taxonomy(self, features=None, taxonomy_path="output/rules/canonical_taxonomy.json", n_boot=1000):
+        """
+        Rank canonical categories by how much more (or less) prevalent they
+        are among VP employees, computed locally from the feature matrix.
+        """
+        if features is None:
+            features = build_feature_matrix(TaxonomyIndex.load())
+
+        results = differential_analysis(
+            features.award_counts, features.labels, features.categories, n_boot=n_boot
+        )
+
+        taxonomy = read_json(taxonomy_path, "taxonomy")
+        for name, stats in results.items():
+            stats["summary"] = taxonomy.get(name, "")
+
+        save_difference_taxonomy(results)
+
+        return results
 
 
     def generate_canonical_taxonomy(self, vp_path, non_vp_path):
-        with open(vp_path, "r", encoding="utf-8") as f:
-            vp = json.load(f)
-        with open(non_vp_path, "r", encoding="utf-8") as f:
-            non_vp = json.load(f)
+        vp = read_json(vp_path, "patterns")
+        non_vp = read_json(non_vp_path, "patterns")
 
         seen = set()
         taxonomy = {}
@@ -73,10 +232,124 @@ class GlobalCluster:
             seen.add(name)
             taxonomy[name] = content.get("summary", "")
 
+        bump_taxonomy_version({"mode": "full", "num_categories": len(taxonomy)})
         save_taxonomy(taxonomy)
+
+        # Compiled alias/phrase index so new phrases classify without an LLM call
+        index = TaxonomyIndex.build(vp, non_vp, phrase_cache=PhraseClusterCache.load_or_build())
+        index.save()
         
         return taxonomy
 
+    def update_taxonomy(self, signals_by_cohort, vp_path="./output/True/pattern_results.json",
+                        non_vp_path="./output/False/pattern_results.json",
+                        taxonomy_path="./output/rules/canonical_taxonomy.json"):
+        """
+        Incrementally fold new cluster names into the existing taxonomy.
+
+        signals_by_cohort maps is_vp -> cluster names. Names are matched
+        against the compiled alias index first; the unmatched ones are
+        assigned or turned into new categories by a small LLM call, or
+        offline by local_engine with the local dedup backend. The cohort
+        pattern_results.json files and canonical_taxonomy.json are updated in
+        place with one version bump and change log entry for the update.
+        """
+        vp = read_json(vp_path, "patterns")
+        non_vp = read_json(non_vp_path, "patterns")
+        taxonomy = read_json(taxonomy_path, "taxonomy")
+
+        created = {}
+        added_aliases = {}
+        changed = []
+        for is_vp, signal_list in signals_by_cohort.items():
+            patterns = vp if is_vp else non_vp
+            cohort_created, cohort_added = self._fold_new_names(signal_list, patterns, vp, non_vp, taxonomy)
+            created.update(cohort_created)
+            taxonomy.update(cohort_created)
+            if cohort_added:
+                added_aliases[str(is_vp)] = cohort_added
+                changed.append(is_vp)
+
+        if not added_aliases:
+            print("Taxonomy is up to date.")
+            return taxonomy
+
+        bump_taxonomy_version({
+            "mode": "incremental",
+            "new_categories": list(created),
+            "added_aliases": added_aliases,
+        })
+        for is_vp in changed:
+            save_final_result(vp if is_vp else non_vp, is_vp)
+        save_taxonomy(taxonomy)
+
+        index = TaxonomyIndex.build(vp, non_vp, phrase_cache=PhraseClusterCache.load_or_build())
+        index.save()
+
+        return taxonomy
+
+    def _fold_new_names(self, signal_list, patterns, vp, non_vp, taxonomy):
+        """Add one cohort's new names to `patterns`; return (created categories, added aliases)."""
+        known = {alias for content in patterns.values() for alias in content.get("aliases", [])}
+        known.update(patterns)
+        new_names = sorted(set(signal_list) - known)
+        if not new_names:
+            return {}, {}
+
+        # Stricter fuzzy matching than phrase classification: these are
+        # category names, a wrong merge is worse than an extra LLM call
+        index = TaxonomyIndex.build(vp, non_vp, fuzzy_threshold=0.7)
+        assignments = {}
+        unmatched = []
+        for name, canonical in zip(new_names, index.classify(new_names)):
+            if canonical is None:
+                unmatched.append(name)
+            else:
+                assignments[name] = canonical
+        print(f"Matched {len(assignments)}/{len(new_names)} new names to existing categories")
+
+        created = {}
+        if unmatched and self.dedup_backend == "local":
+            # Offline: each local group of unmatched names is one category
+            for canonical, content in self._deduplicate_locally(unmatched).items():
+                if canonical not in taxonomy and canonical not in created:
+                    created[canonical] = content.get("summary") or ""
+                for name in content["aliases"]:
+                    assignments[name] = canonical
+        elif unmatched:
+            groups = group_near_duplicates(unmatched)
+            raw = self.llm.call(self._build_assign_prompt(list(groups), taxonomy))
+
+            try:
+                parsed_json = parse_json_from_llm(raw, schema="assignments")
+            except Exception as e:
+                print("JSON PARSE ERROR:", e)
+                parsed_json = {}
+
+            for rep, members in groups.items():
+                entry = parsed_json.get(rep) if isinstance(parsed_json, dict) else None
+                if not isinstance(entry, dict) or not entry.get("category"):
+                    # Unanswered names become their own category
+                    entry = {"category": rep, "summary": ""}
+
+                canonical = entry["category"]
+                if canonical not in taxonomy and canonical not in created:
+                    created[canonical] = entry.get("summary") or ""
+                for name in members:
+                    assignments[name] = canonical
+
+        added_aliases = {}
+        for name, canonical in assignments.items():
+            if canonical not in patterns:
+                summary = taxonomy.get(canonical, created.get(canonical, ""))
+                patterns[canonical] = {"aliases": [], "summary": summary}
+            aliases = patterns[canonical].setdefault("aliases", [])
+            if name not in aliases:
+                aliases.append(name)
+                added_aliases.setdefault(canonical, []).append(name)
+
+        return created, added_aliases
+
 
     def _build_deduplicate_prompt(self, signal_list):
         return f"""
@@ -153,92 +426,66 @@ class GlobalCluster:
             """
 
 
-    def _build_difference_prompt(self, vp, non_vp):
+    def _build_naming_prompt(self, groups):
         return f"""
-        You are given two sets of behavioral cluster names:
-
-        - Group A = treatment group clusters
-        - Group B = control group clusters
-
-        Do NOT assume anything about the groups.
-        Do NOT infer seniority, performance, role level, or importance.
-        Do NOT treat either group as superior or inferior.
-        Both lists must be evaluated equally.
-
-        Your task is to perform a purely semantic comparison and consolidation.
-
-        =====================================================================
-        STEP 1 — Semantic Understanding
-        =====================================================================
-        You must analyze all cluster names from Group A and Group B and determine:
-
-        1. Which clusters express the SAME underlying behavioral concept.
-        2. Which clusters are DISTINCT in meaning.
-        3. Where two names differ in wording but are semantically overlapping.
-
-        Important:
-        - Use SEMANTIC interpretation only, not string matching.
-        - Even if names are different, treat them as equivalent if the meaning aligns.
-        - If two concepts partially overlap, MERGE them.
-        - If uncertain, MERGE rather than split.
-
-        =====================================================================
-        STEP 2 — Build Canonical Competency Categories
-        =====================================================================
-        Using all clusters from BOTH groups:
-
-        Create a unified, deduplicated set of canonical categories.
-
-        For each canonical category:
-        - Choose a clear, general, 2–5 word category name.
-        - Do NOT generate abstract categories beyond what is implied in the data.
-        - Do NOT split a concept into multiple categories.
-
-        Each canonical category must contain:
-        1. "aliases" → all original cluster names (from both groups) that semantically match
-        2. "summary" → a 1–2 sentence explanation of the shared competency meaning
-
-        =====================================================================
-        STEP 3 — Identify semantic group relationships
-        =====================================================================
-        For each canonical category, classify it into:
-
-        - "both_groups": appears semantically in BOTH treatment and control  
-        - "treatment_only": appears ONLY in treatment (no semantic equivalent in control)  
-        - "control_only": appears ONLY in control (no semantic equivalent in treatment)
-
-        Important:
-        - This determination must be SEMANTIC, not based on name overlap.
-        - Two differently worded clusters count as "both_groups" if they express the same idea.
-
-        =====================================================================
-        STEP 4 — Output Format (JSON only)
-        =====================================================================
-        Return a single JSON object in this exact structure:
-
-        {
-        "<canonical_category>": {
-            "aliases": [ ... all original cluster names ... ],
-            "summary": "1–2 sentence meaning summary.",
-            "group_presence": "both_groups" | "treatment_only" | "control_only"
-        },
-        ...
-        }
-
-        NO commentary.  
-        NO markdown.  
-        JSON only.
-
-        =====================================================================
-        NOW ANALYZE THE FOLLOWING:
-        =====================================================================
-
-        Group A (treatment):
-        {vp}
-
-        Group B (control):
-        {non_vp}
-        """
+        You are given groups of behavior cluster names that were already
+        deduplicated. Do NOT move names between groups and do NOT merge or
+        split groups.
 
-    
-    
\ No newline at end of file
+        For each group:
+        - Select ONE canonical name: the MOST GENERAL name that still captures
+          all aliases in the group.
+        - Write a neutral 1–2 sentence summary capturing ONLY the meaning
+          shared by all aliases.
+
+        Return a single JSON object keyed by the group id:
+
+        {{
+        "<group_id>": {{
+            "name": "...",
+            "summary": "..."
+        }}
+        }}
+
+        Return ONLY a JSON object.
+        ===============================================================
+        GROUPS:
+        ===============================================================
+        {json.dumps(groups, ensure_ascii=False, indent=1)}
+            """
+
+
+    def _build_assign_prompt(self, names, taxonomy):
+        return f"""
+        You will assign NEW behavior cluster names to an EXISTING taxonomy of
+        canonical competency categories.
+
+        For each new name:
+        - If it is semantically covered by an existing category, assign it
+          to that category, using the category name EXACTLY as written.
+        - Create a new category ONLY if its meaning is clearly different from
+          every existing category. A new category needs a general 2–5 word
+          name and a neutral 1–2 sentence summary.
+        - When uncertain, assign to the closest existing category.
+
+        ===============================================================
+        Output Format (JSON ONLY)
+        ===============================================================
+        {{
+        "<new_name>": {{
+            "category": "<existing or new category name>",
+            "summary": "<only for new categories>"
+        }}
+        }}
+
+        Return ONLY a JSON object.
+        ===============================================================
+        EXISTING CATEGORIES:
+        ===============================================================
+        {json.dumps(taxonomy, ensure_ascii=False, indent=1)}
+
+        ===============================================================
+        NEW NAMES:
+        ===============================================================
+        {json.dumps(names, ensure_ascii=False)}
+            """
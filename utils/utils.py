@@ -1,68 +1,182 @@
 import signal
 import tiktoken
 import os, json
+import re
+import gzip
+import hashlib
+import shutil
+from datetime import datetime
+from collections.abc import Mapping, Sequence
 from dotenv import load_dotenv
 
+from src.tracing import tracer
+from src.compact import EmployeeStore
+from src.schemas import decode, decode_entries, encode
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
 load_dotenv()
 enc = tiktoken.get_encoding("cl100k_base")
 CONFIG_PATH = "./config/llm_providers.json"
 
-def chunk_awards(rec_id, awards_list, max_tokens=40000):
-    chunks = []
-    current_chunk = ""
-    current_tokens = 0
+# Debug dumps of the award chunks sent to the LLM. Disable in production runs
+# with SAVE_DEBUG_CHUNKS=false.
+SAVE_DEBUG_CHUNKS = os.environ.get("SAVE_DEBUG_CHUNKS", "true").lower() not in ("0", "false", "no", "off")
+CHUNK_STORE_DIR = "chunks"
 
-    for award_idx, award in enumerate(awards_list):
-        title = award.get("title", "").strip()
-        message = award.get("message", "").strip()
+# Machine-consumed result files (keywords, clustering and pattern results)
+# are written compact; PRETTY_JSON=true indents them for debugging.
+PRETTY_JSON = os.environ.get("PRETTY_JSON", "false").lower() in ("1", "true", "yes", "on")
 
-        award_text = (
-            f"{award_idx}#{title}|{message}\n\n"
-        )
+def count_tokens(text):
+    return len(enc.encode(text))
 
-        award_tokens = len(enc.encode(award_text))
+def chunk_awards(rec_id, awards_list, max_tokens=40000, save_debug_chunks=None, output_dir="output"):
+    with tracer.span("chunk", rec_id=rec_id, num_awards=len(awards_list)) as span:
+        chunks = []
+        chunk_tokens = []
+        current_chunk = ""
+        current_tokens = 0
 
-        # if adding this text exceeds limit → finalize current chunk
-        if current_tokens + award_tokens > max_tokens:
-            chunks.append(current_chunk)
-            current_chunk = award_text
-            current_tokens = award_tokens
-        else:
-            current_chunk += award_text
-            current_tokens += award_tokens
+        for award_idx, award in enumerate(awards_list):
+            title = award.get("title", "").strip()
+            message = award.get("message", "").strip()
+
+            award_text = (
+                f"{award_idx}#{title}|{message}\n\n"
+            )
+
+            award_tokens = len(enc.encode(award_text))
+
+            # if adding this text exceeds limit → finalize current chunk
+            if current_tokens + award_tokens > max_tokens:
+                chunks.append(current_chunk)
+                chunk_tokens.append(current_tokens)
+                current_chunk = award_text
+                current_tokens = award_tokens
+            else:
+                current_chunk += award_text
+                current_tokens += award_tokens
 
 
-    if current_chunk.strip():
-        chunks.append(current_chunk)
+        if current_chunk.strip():
+            chunks.append(current_chunk)
+            chunk_tokens.append(current_tokens)
+
+        span.update(num_chunks=len(chunks), tokens=sum(chunk_tokens), chunk_tokens=chunk_tokens)
 
-    save_chunks(rec_id, chunks)
+    if save_debug_chunks is None:
+        save_debug_chunks = SAVE_DEBUG_CHUNKS
+    if save_debug_chunks:
+        with tracer.span("save", rec_id=rec_id, kind="chunks"):
+            save_chunks(rec_id, chunks, output_dir=output_dir)
 
     return chunks
 
 
 
+
+def _find_chunk_blob(blob_dir, digest):
+    for ext in (".zst", ".gz"):
+        path = os.path.join(blob_dir, digest + ext)
+        if os.path.exists(path):
+            return path
+    return None
+
 def save_chunks(employee_id, chunks, output_dir="output"):
-    
+    """
+    Store the award chunks as a compressed, content-addressed blob under
+    <output_dir>/chunks/<sha[:2]>/<sha>.{zst,gz} and point the employee's
+    ref file at it. Unchanged content is never rewritten.
+    """
+    payload = "".join(json.dumps(chunk, ensure_ascii=False) + "\n" for chunk in chunks).encode("utf-8")
+    digest = hashlib.sha256(payload).hexdigest()
+
+    blob_dir = os.path.join(output_dir, CHUNK_STORE_DIR, digest[:2])
+    blob_path = _find_chunk_blob(blob_dir, digest)
+
+    if blob_path is None:
+        if zstandard is not None:
+            data = zstandard.ZstdCompressor(level=10).compress(payload)
+            blob_path = os.path.join(blob_dir, digest + ".zst")
+        else:
+            data = gzip.compress(payload, compresslevel=6)
+            blob_path = os.path.join(blob_dir, digest + ".gz")
+
+        os.makedirs(blob_dir, exist_ok=True)
+        tmp_path = blob_path + ".tmp"
+        with open(tmp_path, "wb") as f:
+            f.write(data)
+        os.replace(tmp_path, blob_path)
+
+    ref = {
+        "sha256": digest,
+        "blob": os.path.relpath(blob_path, output_dir),
+        "num_chunks": len(chunks),
+    }
+    ref_path = os.path.join(output_dir, f"employee_{employee_id}_award_chunks.ref.json")
+
+    try:
+        with open(ref_path, "r", encoding="utf-8") as f:
+            unchanged = json.load(f).get("sha256") == digest
+    except (OSError, ValueError):
+        unchanged = False
+
+    if not unchanged:
+        with open(ref_path, "w", encoding="utf-8") as f:
+            json.dump(ref, f, ensure_ascii=False)
+        print(f"Saved {len(chunks)} chunks to {ref['blob']}")
+
+    return digest
+
+
+def load_chunks(employee_id, output_dir="output"):
+    ref_path = os.path.join(output_dir, f"employee_{employee_id}_award_chunks.ref.json")
+
+    if os.path.exists(ref_path):
+        with open(ref_path, "r", encoding="utf-8") as f:
+            ref = json.load(f)
+        blob_path = os.path.join(output_dir, ref["blob"])
+
+        with open(blob_path, "rb") as f:
+            data = f.read()
+        if blob_path.endswith(".zst"):
+            if zstandard is None:
+                raise ImportError("zstandard is required to read " + blob_path)
+            payload = zstandard.ZstdDecompressor().decompress(data)
+        else:
+            payload = gzip.decompress(data)
 
-    os.makedirs(output_dir, exist_ok=True)
+        if hashlib.sha256(payload).hexdigest() != ref["sha256"]:
+            raise ValueError(f"Chunk blob does not match its hash: {blob_path}")
+        lines = payload.decode("utf-8").splitlines()
+    else:
+        # Legacy uncompressed dump
+        legacy_path = os.path.join(output_dir, f"employee_{employee_id}_award_chunks.jsonl")
+        with open(legacy_path, "r", encoding="utf-8") as f:
+            lines = f.read().splitlines()
 
-    file_path = os.path.join(output_dir, f"employee_{employee_id}_award_chunks.jsonl")
+    return [json.loads(line) for line in lines if line]
 
-    with open(file_path, "w", encoding="utf-8") as f:
-        for chunk in chunks:
-            f.write(json.dumps(chunk, ensure_ascii=False) + "\n")
 
-    print(f"Saved {len(chunks)} chunks to {file_path}")
-    return file_path
+def write_json(path, obj, pretty=False):
+    with open(path, "wb") as f:
+        f.write(encode(obj, pretty=pretty))
+    return path
 
+def read_json(path, schema=None):
+    """Read a JSON file, validated against src.schemas.SCHEMAS[schema] if given."""
+    with open(path, "rb") as f:
+        return decode(f.read(), schema)
 
 def save_employee_signals(rec_id: int, results: dict, folder: str = "output"):
     os.makedirs(folder, exist_ok=True)
 
     save_path = f"{folder}/employee_{rec_id}_keywords.json"
-
-    with open(save_path, "w", encoding="utf-8") as f:
-        json.dump(results, f, indent=2, ensure_ascii=False)
+    write_json(save_path, results, pretty=PRETTY_JSON)
 
     print(f"[Saved] {save_path}")
     return save_path
@@ -72,30 +186,70 @@ def save_clustering_result(rec_id: int, results, is_vp, folder: str = "output"):
     os.makedirs(folder_path, exist_ok=True)
 
     save_path = f"{folder_path}/employee_{rec_id}_clustering_result.json"
-
-    with open(save_path, "w", encoding="utf-8") as f:
-        json.dump(results, f, indent=2, ensure_ascii=False)
+    write_json(save_path, results, pretty=PRETTY_JSON)
 
     print(f"[Saved] {save_path}")
     return save_path
 
-def save_clustering_result(rec_id: int, results, is_vp, folder: str = "output"):
+def save_final_result(results, is_vp, folder: str = "output"):
     folder_path = f"{folder}/{is_vp}"
     os.makedirs(folder_path, exist_ok=True)
 
-    save_path = f"{folder_path}/employee_{rec_id}_clustering_result.json"
+    save_path = f"{folder_path}/pattern_results.json"
+    write_json(save_path, results, pretty=PRETTY_JSON)
 
-    with open(save_path, "w", encoding="utf-8") as f:
-        json.dump(results, f, indent=2, ensure_ascii=False)
+    print(f"[Saved] {save_path}")
+    return save_path
+
+def save_taxonomy(taxonomy, folder: str="output"):
+    folder_path = f"{folder}/rules"
+    os.makedirs(folder_path, exist_ok=True)
+
+    save_path = f"{folder_path}/canonical_taxonomy.json"
+    # rules/ files are read by people too; keep them indented
+    write_json(save_path, taxonomy, pretty=True)
 
     print(f"[Saved] {save_path}")
     return save_path
 
-def save_final_result(results, is_vp, folder: str = "output"):
-    folder_path = f"{folder}/{is_vp}"
+def bump_taxonomy_version(changes, folder: str="output"):
+    """
+    Snapshot the current canonical_taxonomy.json under rules/versions/ and
+    append a change log entry to rules/taxonomy_version.json. Call before
+    overwriting the taxonomy.
+    """
+    folder_path = f"{folder}/rules"
+    os.makedirs(f"{folder_path}/versions", exist_ok=True)
+
+    version_path = f"{folder_path}/taxonomy_version.json"
+    if os.path.exists(version_path):
+        with open(version_path, "r", encoding="utf-8") as f:
+            version_info = json.load(f)
+    else:
+        version_info = {"version": 0, "history": []}
+
+    taxonomy_path = f"{folder_path}/canonical_taxonomy.json"
+    if os.path.exists(taxonomy_path):
+        shutil.copyfile(taxonomy_path, f"{folder_path}/versions/canonical_taxonomy.v{version_info['version']}.json")
+
+    version_info["version"] += 1
+    version_info["history"].append({
+        "version": version_info["version"],
+        "updated_at": datetime.now().isoformat(timespec="seconds"),
+        **changes,
+    })
+
+    with open(version_path, "w", encoding="utf-8") as f:
+        json.dump(version_info, f, indent=2, ensure_ascii=False)
+
+    print(f"[Taxonomy] version {version_info['version']}")
+    return version_info["version"]
+
+def save_difference_taxonomy(results, folder: str="output"):
+    folder_path = f"{folder}/rules"
     os.makedirs(folder_path, exist_ok=True)
 
-    save_path = f"{folder_path}/pattern_results.json"
+    save_path = f"{folder_path}/difference_taxonomy.json"
 
     with open(save_path, "w", encoding="utf-8") as f:
         json.dump(results, f, indent=2, ensure_ascii=False)
@@ -103,26 +257,88 @@ def save_final_result(results, is_vp, folder: str = "output"):
     print(f"[Saved] {save_path}")
     return save_path
 
-def save_taxonomy(taxonomy, folder: str="output"):
-    folder_path = f"{folder}/rules"
-    os.makedirs(folder_path, exist_ok=True)
 
-    save_path = f"{folder_path}/canonical_taxonomy.json"
+def _json_default(obj):
+    # Compact employee/award views (src/compact.py) serialize like the dicts they stand in for
+    if isinstance(obj, Mapping):
+        return dict(obj)
+    if isinstance(obj, Sequence):
+        return list(obj)
+    raise TypeError(f"Object of type {type(obj).__name__} is not JSON serializable")
+
+def save_employee_list(employee_list, save_path: str = "output/employees.jsonl"):
+    os.makedirs(os.path.dirname(save_path) or ".", exist_ok=True)
 
     with open(save_path, "w", encoding="utf-8") as f:
-        json.dump(taxonomy, f, indent=2, ensure_ascii=False)
+        for emp in employee_list:
+            f.write(json.dumps(emp, ensure_ascii=False, default=_json_default) + "\n")
 
     print(f"[Saved] {save_path}")
     return save_path
 
+def load_employee_list(path: str = "output/employees.jsonl", compact: bool = False):
+    with open(path, "r", encoding="utf-8") as f:
+        records = (json.loads(line) for line in f if line.strip())
+        if compact:
+            return EmployeeStore.from_records(records)
+        return list(records)
+
 
-def parse_json_from_llm(text):
+def parse_json_from_llm(text, schema=None):
+    """Parse an LLM JSON reply; with a schema, invalid entries are dropped one by one."""
     clean = (
         text.replace("```json", "")
             .replace("```", "")
             .strip()
     )
-    return json.loads(clean)
+    if schema:
+        return decode_entries(clean, schema)
+    return decode(clean)
+
+# award_idx<TAB>chunk_idx<TAB>signal; the regex also accepts models that emit spaces for tabs
+SIGNAL_LINE_RE = re.compile(r"^\s*(\d+)\s+(\d+)\s+(.+?)\s*$")
+
+def _iter_lines(text):
+    if isinstance(text, str):
+        yield from text.splitlines()
+        return
+
+    pending = ""
+    for fragment in text:
+        pending += fragment
+        *lines, pending = pending.split("\n")
+        yield from lines
+    if pending:
+        yield pending
+
+def parse_signal_lines(text):
+    """
+    Parse the compact extraction format (one award_idx<TAB>chunk_idx<TAB>signal
+    line per signal) into the same {award: {chunk: [signals]}} structure as
+    the JSON format. text may be a string or an iterable of streamed
+    fragments. Fences, blank and malformed lines are skipped.
+    """
+    results = {}
+
+    for line in _iter_lines(text):
+        parts = line.split("\t", 2)
+        if len(parts) == 3 and parts[0].strip().isdigit() and parts[1].strip().isdigit():
+            award, chunk, signal = parts
+        else:
+            match = SIGNAL_LINE_RE.match(line)
+            if not match:
+                continue
+            award, chunk, signal = match.groups()
+
+        signal = signal.strip().strip('"').strip()
+        if not signal:
+            continue
+
+        chunk_signals = results.setdefault(award.strip(), {}).setdefault(chunk.strip(), [])
+        if signal not in chunk_signals:
+            chunk_signals.append(signal)
+
+    return results
 
 def extract_phrase_set(signal_json):
     phrases = []
@@ -145,12 +361,12 @@ def merge_signal_set(folder):
     signal_set = set()
 
     for fname in os.listdir(folder):
-        if not fname.endswith(".json"):
+        # Only per-employee results; pattern_results.json lives here too
+        if not (fname.startswith("employee_") and fname.endswith("_clustering_result.json")):
             continue
         fpath = os.path.join(folder, fname)
         try:
-            with open(fpath, "r", encoding="utf-8") as f:
-                data = json.load(f)
+            data = read_json(fpath, "clusters")
         except Exception as e:
             print(f"[WARN] Failed to read JSON: {fpath} ({e})")
             continue